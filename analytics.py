@@ -0,0 +1,128 @@
+"""Quiz analytics kept as counters
+
+Every statistic the dashboard shows is a sum over submissions, so it is stored
+as named counters (see ``AnalyticsCounter`` in main.py) that each submission
+bumps inside its own transaction.  Reading the dashboard is then one scan of
+a table whose size depends on the question bank, not on the number of
+participants.  ``count_submissions`` produces the increments for one
+submission or for every stored attempt at once, so a full recompute and the
+per-submission path share one vectorized implementation.
+
+Counter names:
+
+``submissions``                     submitted attempts
+``score.<n>``                       attempts scoring n
+``q<id>.shown|answered|correct``    per question
+``q<id>.option<i>``                 times bank option i was chosen
+``category.<c>.points|possible``    correct answers / questions asked
+``branch.<b>.count|points``         attempts and total score per branch
+``year.<y>.count|points``           the same per year
+"""
+from collections import Counter
+
+import numpy as np
+
+
+def count_submissions(answer_key, rows):
+    """Counter increments for rows of (question_ids, answers, branch, year)
+
+    Scores are computed from the answers with ``answer_key``, so the counters
+    always agree with the key they were built from.
+    """
+    rows = list(rows)
+    counts = Counter()
+    if not rows:
+        return counts
+
+    n_questions = len(answer_key.question_ids)
+    shown = np.zeros((len(rows), n_questions), dtype=bool)
+    masks = np.zeros((len(rows), n_questions), dtype=np.uint32)
+    for i, (question_ids, answers, _, _) in enumerate(rows):
+        columns = [answer_key.column[qid] for qid in question_ids if qid in answer_key.column]
+        shown[i, columns] = True
+        masks[i] = answer_key.encode_row(answers or {})
+
+    totals, by_category = answer_key.score_batch(masks)
+    correct = masks == answer_key.keys
+    counts["submissions"] = len(rows)
+
+    per_question = zip(answer_key.question_ids, shown.sum(axis=0).tolist(),
+                       (masks != 0).sum(axis=0).tolist(), correct.sum(axis=0).tolist())
+    for qid, n_shown, n_answered, n_correct in per_question:
+        counts[f"q{qid}.shown"] += n_shown
+        counts[f"q{qid}.answered"] += n_answered
+        counts[f"q{qid}.correct"] += n_correct
+
+    # Only the option bits anyone actually chose
+    for bit in range(int(np.bitwise_or.reduce(masks, axis=None)).bit_length()):
+        chosen = ((masks >> np.uint32(bit)) & 1).sum(axis=0)
+        for qid, n in zip(answer_key.question_ids, chosen.tolist()):
+            if n:
+                counts[f"q{qid}.option{bit}"] += n
+
+    for score, n in enumerate(np.bincount(totals).tolist()):
+        if n:
+            counts[f"score.{score}"] += n
+
+    possible = shown.astype(np.int32) @ answer_key.category_matrix
+    for c, points, asked in zip(answer_key.categories, by_category.sum(axis=0).tolist(),
+                                possible.sum(axis=0).tolist()):
+        counts[f"category.{c}.points"] += points
+        counts[f"category.{c}.possible"] += asked
+
+    for field, position in (("branch", 2), ("year", 3)):
+        groups, index = np.unique([str(row[position] or "Unknown") for row in rows], return_inverse=True)
+        for group, n, points in zip(groups.tolist(), np.bincount(index).tolist(),
+                                    np.bincount(index, weights=totals).tolist()):
+            counts[f"{field}.{group}.count"] += n
+            counts[f"{field}.{group}.points"] += int(points)
+
+    return counts
+
+
+def _ratio(part, whole):
+    return round(part / whole * 100, 1) if whole else None
+
+
+def summarize(counts, bank):
+    """Dashboard view of the counters for the current question bank"""
+    submissions = counts.get("submissions", 0)
+    questions = []
+    for q in bank.questions:
+        shown = counts.get(f"q{q.id}.shown", 0)
+        correct = counts.get(f"q{q.id}.correct", 0)
+        questions.append({
+            "id": q.id,
+            "category": q.category,
+            "question": q.question,
+            "shown": shown,
+            "answered": counts.get(f"q{q.id}.answered", 0),
+            "correct": correct,
+            "percent_correct": _ratio(correct, shown),
+            "options": [{"option": option, "chosen": counts.get(f"q{q.id}.option{i}", 0)}
+                        for i, option in enumerate(q.options)]
+        })
+
+    groups = {"score": {}, "category": {}, "branch": {}, "year": {}}
+    for name, value in counts.items():
+        field, _, rest = name.partition(".")
+        if field == "score":
+            groups["score"][int(rest)] = value
+        elif field in groups:
+            group, _, stat = rest.rpartition(".")
+            groups[field].setdefault(group, {})[stat] = value
+
+    return {
+        "submissions": submissions,
+        "questions": questions,
+        "score_histogram": [{"score": s, "count": n} for s, n in sorted(groups["score"].items())],
+        "categories": {c: {"points": v.get("points", 0), "possible": v.get("possible", 0),
+                           "percent_correct": _ratio(v.get("points", 0), v.get("possible", 0))}
+                       for c, v in groups["category"].items()},
+        "branches": {b: {"count": v.get("count", 0),
+                         "average_score": round(v.get("points", 0) / v["count"], 2) if v.get("count") else None}
+                     for b, v in groups["branch"].items()},
+        "years": {y: {"count": v.get("count", 0),
+                      "average_score": round(v.get("points", 0) / v["count"], 2) if v.get("count") else None}
+                  for y, v in groups["year"].items()}
+    }
@@ -0,0 +1,65 @@
+"""Compact attempt encoding
+
+A paper drawn by the sampler is fully described by the bank version, the
+sampler seed and the paper spec, so attempts store those instead of question
+ids and option orders.  Answers are stored as an answer bitmap: one
+little-endian uint32 per question in display order, with bit ``i`` set when
+bank option ``i`` was chosen (the same encoding the grading engine uses).
+Archived banks are stored zlib-compressed so old attempts stay decodable
+after questions.json changes.
+"""
+import json
+import zlib
+
+import numpy as np
+
+from question_bank import parse_bank
+
+ANSWER_DTYPE = np.dtype("<u4")
+
+
+def encode_answers(bank, question_ids, answers):
+    """Pack {question_id: [chosen options]} into an answer bitmap"""
+    masks = np.zeros(len(question_ids), dtype=ANSWER_DTYPE)
+    for i, qid in enumerate(question_ids):
+        q = bank.by_id.get(qid)
+        choices = answers.get(str(qid))
+        if q is None or not choices:
+            continue
+        if not q.multiple:
+            choices = choices[:1]
+        for choice in choices:
+            if choice in q.options:
+                masks[i] |= 1 << q.options.index(choice)
+    return masks.tobytes()
+
+
+def decode_answers(bank, question_ids, data):
+    """Unpack an answer bitmap into {question_id: [chosen options]}"""
+    masks = np.frombuffer(data, dtype=ANSWER_DTYPE).tolist()
+    answers = {}
+    for qid, mask in zip(question_ids, masks):
+        q = bank.by_id.get(qid)
+        if q is None:
+            continue
+        answers[str(qid)] = [option for n, option in enumerate(q.options) if mask >> n & 1]
+    return answers
+
+
+def serialize_bank(bank):
+    """Compressed JSON of a bank snapshot, for archiving"""
+    questions = [{
+        "id": q.id,
+        "category": q.category,
+        "difficulty": q.difficulty,
+        "question": q.question,
+        "options": list(q.options),
+        "answer": list(q.answer) if q.multiple else q.answer,
+        "multiple": q.multiple
+    } for q in bank.questions]
+    return zlib.compress(json.dumps(questions, separators=(",", ":")).encode())
+
+
+def deserialize_bank(version, data):
+    """Rebuild an archived snapshot under its original version"""
+    return parse_bank(zlib.decompress(data), version=version)
@@ -0,0 +1,83 @@
+"""Bytes stored per attempt under each encoding
+
+Compares, for the same random papers and answers:
+
+- full copy: question dicts plus the answers JSON, as participant.questions
+  and participant.answers used to store them
+- id list: question ids, option orders and answers JSON on quiz_attempt
+- compact: seed, paper spec and answer bitmap
+
+Uses questions.json, or a synthetic bank with longer question text.
+
+    python benchmarks/attempt_storage.py [--attempts 1000] [--synthetic 5000] [--spec any:2]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from attempts import decode_answers, encode_answers  # noqa: E402
+from question_bank import QuestionBank, parse_bank  # noqa: E402
+from sampler import Sampler, parse_spec  # noqa: E402
+
+
+def synthetic_bank(size):
+    questions = []
+    for i in range(1, size + 1):
+        options = [f"A fairly descriptive answer option number {j} for question {i}" for j in range(4)]
+        questions.append({
+            "id": i,
+            "category": ("Math", "Reasoning", "Verbal")[i % 3],
+            "question": f"Question {i}: read the passage carefully and pick the best answer. " * 3,
+            "options": options,
+            "answer": options[i % 4]
+        })
+    return parse_bank(json.dumps(questions).encode())
+
+
+def measure(bank, spec_text, attempts):
+    sampler = Sampler(bank)
+    spec = parse_spec(spec_text)
+    totals = {"full copy": 0, "id list": 0, "compact": 0}
+    for _ in range(attempts):
+        seed = random.getrandbits(63)
+        question_ids, option_orders = sampler.draw(seed, spec)
+        answers = {str(qid): [random.choice(bank.by_id[qid].options)] for qid in question_ids}
+
+        questions = []
+        for qid, order in zip(question_ids, option_orders):
+            question = bank.by_id[qid]._asdict()
+            question["options"] = [question["options"][i] for i in order]
+            questions.append(question)
+        totals["full copy"] += len(json.dumps(questions)) + len(json.dumps(answers))
+        totals["id list"] += len(json.dumps(question_ids)) + len(json.dumps(option_orders)) + len(json.dumps(answers))
+
+        bits = encode_answers(bank, question_ids, answers)
+        assert decode_answers(bank, question_ids, bits) == answers
+        totals["compact"] += 8 + len(spec_text) + len(bits)  # BIGINT seed, spec text, bitmap
+
+    compact = totals["compact"] / attempts
+    for label, total in totals.items():
+        per_attempt = total / attempts
+        print(f"  {label:10s} {per_attempt:8.0f} bytes per attempt ({per_attempt / compact:5.1f}x compact)")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--attempts", type=int, default=1000)
+    parser.add_argument("--synthetic", type=int, default=5000, help="questions in the synthetic bank")
+    parser.add_argument("--spec", default="any:2")
+    args = parser.parse_args()
+
+    print("questions.json:")
+    measure(QuestionBank(os.path.join(ROOT, "questions.json")).get(), args.spec, args.attempts)
+    print(f"synthetic bank of {args.synthetic}, 10 per category:")
+    measure(synthetic_bank(args.synthetic), "any:10", args.attempts)
+
+
+if __name__ == "__main__":
+    run()
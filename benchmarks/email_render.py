@@ -0,0 +1,72 @@
+"""Results email rendering time for long exams
+
+Builds a synthetic question bank of each size, answers every question at
+random and times build_results_email, which renders both the HTML and the
+plain-text part.
+
+    python benchmarks/email_render.py [--sizes 100 500 1000] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp()
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP, 'participants.db')}"
+os.environ["SESSION_BACKEND"] = "memory"
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import main  # noqa: E402
+from question_bank import QuestionBank  # noqa: E402
+
+
+def synthetic_bank(size):
+    path = os.path.join(TMP, f"questions_{size}.json")
+    questions = []
+    for i in range(1, size + 1):
+        options = [f"Option {i}.{j} <with markup & entities>" for j in range(4)]
+        questions.append({
+            "id": i,
+            "category": ("Math", "Reasoning", "Verbal")[i * 3 // (size + 1)],
+            "question": f"Question {i}: which of these is right? " * 3,
+            "options": options,
+            "answer": options[i % 4]
+        })
+    with open(path, "w") as f:
+        json.dump(questions, f)
+    return QuestionBank(path)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    main.app.config["MAIL_DEFAULT_SENDER"] = "club@example.com"
+    for size in args.sizes:
+        main.question_bank = synthetic_bank(size)
+        bank = main.question_bank.get()
+        questions = [q._asdict() for q in bank.questions]
+        answers = {str(q.id): [random.choice(q.options)] for q in bank.questions}
+
+        with main.app.app_context():
+            main.build_results_email("user@example.com", questions, answers, 0)  # Compile templates
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                message = main.build_results_email("user@example.com", questions, answers, 0)
+            elapsed = (time.perf_counter() - start) / args.repeat
+
+        size_kb = (len(message.html) + len(message.body)) / 1024
+        print(f"{size:5d} questions: {elapsed * 1000:7.2f} ms per email, "
+              f"{1 / elapsed:8.1f} emails/s, {size_kb:.0f} KB")
+
+
+if __name__ == "__main__":
+    run()
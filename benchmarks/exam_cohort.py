@@ -0,0 +1,280 @@
+"""End-to-end exam load test: a whole cohort, offline
+
+Runs the app and a fake Google OAuth provider (fake_google.py) in a server
+subprocess with a throwaway database, then simulates N students:
+
+    google_login -> profile -> instructions -> quiz -> thank_you
+
+Students log in and fill in their profile as they trickle in over the ramp
+period, wait on the instructions page until the whole hall is in, and then
+start the quiz together.  They answer with think time per question; a
+fraction submit early and everyone else is auto-submitted at the same moment
+when the quiz timer runs out, as quiz_timer.js does.  Answers are autosaved
+as they are chosen, as quiz_autosave.js does.  Each app request is timed on
+its own (redirects are followed by hand) and reported per route as
+p50/p95/p99 latency and error rate.
+
+    python benchmarks/exam_cohort.py [--users 300] [--timer 300] [--time-scale 0.1]
+
+``--time-scale`` shrinks think times, the ramp and the timer alike, so the
+default run takes about 40 seconds instead of six minutes.  Server settings
+come from the environment (SESSION_BACKEND, GROUP_COMMIT, ...), so the same
+cohort can be replayed against each configuration.
+"""
+import argparse
+import html
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTION_RE = re.compile(r'name="(q\d+)" value="([^"]*)"')
+ATTEMPT_RE = re.compile(r'data-attempt="(\d+)"')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port, fake_port):
+    """Server subprocess: the app on ``port``, fake Google on ``fake_port``"""
+    import logging
+
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, ROOT)
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # After ROOT: benchmarks/sampler.py shadows sampler
+    os.chdir(ROOT)
+    import main
+    from fake_google import create_fake_google, point_blueprint_at
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    point_blueprint_at(main.google_bp, f"http://127.0.0.1:{fake_port}")
+    fake = make_server("127.0.0.1", fake_port, create_fake_google(), threaded=True)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    make_server("127.0.0.1", port, main.app, threaded=True).serve_forever()
+
+
+def start_server(tmp):
+    port, fake_port = free_port(), free_port()
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "loadtest")
+    env.setdefault("SESSION_BACKEND", "memory")
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'participants.db')}",
+        "GOOGLE_CLIENT_ID": "loadtest",
+        "GOOGLE_CLIENT_SECRET": "loadtest",
+        "OAUTHLIB_INSECURE_TRANSPORT": "1",
+        "OAUTHLIB_RELAX_TOKEN_SCOPE": "1",
+    })
+    log = open(os.path.join(tmp, "server.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port), str(fake_port)],
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            requests.get(base, timeout=1)
+            return process, base, f"http://127.0.0.1:{fake_port}"
+        except requests.ConnectionError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Server did not start, see {log.name}")
+
+
+class Stats:
+    """Latencies and errors per route, plus flows that ended on the wrong page"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.flow_errors = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def flow_error(self, step, landed_on):
+        with self._lock:
+            self.flow_errors[f"{step} ended on {landed_on}"] += 1
+
+
+class Student:
+    def __init__(self, n, base, fake, stats):
+        self.email = f"student{n}@example.com"
+        self.n = n
+        self.base = base
+        self.fake = fake
+        self.stats = stats
+        self.http = requests.Session()
+
+    def browse(self, method, path, data=None):
+        """Make a request and follow redirects by hand, timing each app hop"""
+        url = urljoin(self.base, path)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                response = self.http.request(method, url, data=data, allow_redirects=False, timeout=120)
+            except requests.RequestException:
+                if url.startswith(self.base):
+                    self.stats.record(urlparse(url).path, time.perf_counter() - t0, False)
+                return url, None
+            if url.startswith(self.base):
+                self.stats.record(urlparse(url).path, time.perf_counter() - t0, response.status_code < 400)
+            if not response.is_redirect:
+                return url, response
+            url = urljoin(url, response.headers["Location"])
+            method, data = "GET", None
+
+    def browse_json(self, path, body):
+        url = urljoin(self.base, path)
+        t0 = time.perf_counter()
+        try:
+            response = self.http.post(url, json=body, allow_redirects=False, timeout=120)
+        except requests.RequestException:
+            response = None
+        self.stats.record(path, time.perf_counter() - t0, response is not None and response.status_code < 400)
+        return url, response
+
+    def step(self, name, method, path, expect, data=None):
+        url, response = self.browse(method, path, data)
+        landed = urlparse(url).path
+        if response is None or landed != expect:
+            self.stats.flow_error(name, landed)
+            return None
+        return response
+
+    def arrive(self, scale):
+        """Log in, complete the profile and open the instructions"""
+        self.http.get(f"{self.fake}/as", params={"email": self.email}, timeout=30)
+        if not self.step("login", "GET", "/google_login", "/profile"):
+            return False
+        time.sleep(random.uniform(10, 40) * scale)  # Filling in the form
+        profile = {"urn": str(100000 + self.n), "crn": "", "branch": random.choice(["CSE", "IT", "ECE"]),
+                   "year": str(random.randint(1, 4))}
+        return bool(self.step("profile", "POST", "/profile", "/instructions", data=profile))
+
+    def take_quiz(self, deadline, submit_early, scale):
+        response = self.step("quiz start", "GET", "/quiz", "/quiz")
+        if not response:
+            return
+        options = defaultdict(list)
+        for name, value in OPTION_RE.findall(response.text):
+            options[name].append(html.unescape(value))
+        attempt = ATTEMPT_RE.search(response.text)
+
+        answers = {"answers_included": "1"}  # The hidden field quiz.html sends with every submit
+        unsaved = {}
+        for seq, (name, choices) in enumerate(options.items(), 1):
+            think = random.uniform(10, 60) * scale
+            if not submit_early and time.monotonic() + think >= deadline:
+                break  # Still thinking when the timer runs out
+            time.sleep(think)
+            answers[name] = random.choice(choices)
+            if attempt:
+                # quiz_autosave.js sends each change once the student pauses
+                batch = {"attempt": int(attempt.group(1)), "seq": seq, "answers": {name[1:]: [answers[name]]}}
+                url, saved = self.browse_json("/quiz/answers", batch)
+                if saved is None or not saved.ok:
+                    self.stats.flow_error("autosave", urlparse(url).path)
+                    unsaved[name[1:]] = [answers[name]]
+        if attempt:
+            # quiz_autosave.js replaces the answers with the ones the server has not acknowledged
+            answers = {"answers_included": "1", "attempt": attempt.group(1), "unsaved_answers": json.dumps(unsaved)}
+
+        if submit_early:
+            self.step("submit", "POST", "/quiz", "/thank_you", data=answers)
+        else:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            self.step("auto-submit", "POST", "/quiz", "/thank_you", data={**answers, "time_up": "true"})
+
+
+def run_cohort(args, base, fake):
+    stats = Stats()
+    hall = threading.Barrier(args.users)
+    start = {}
+
+    def student(n):
+        person = Student(n, base, fake, stats)
+        time.sleep(random.uniform(0, args.ramp) * args.time_scale)
+        try:
+            ready = person.arrive(args.time_scale)
+        finally:
+            # Everyone starts together; the first one through sets the shared deadline
+            if hall.wait() == 0:
+                start["deadline"] = time.monotonic() + args.timer * args.time_scale
+        if ready:
+            while "deadline" not in start:
+                time.sleep(0.001)
+            person.take_quiz(start["deadline"], random.random() < args.early, args.time_scale)
+
+    threads = [threading.Thread(target=student, args=(n,), daemon=True) for n in range(args.users)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stats, time.perf_counter() - began
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+def report(stats, elapsed, users):
+    print(f"{users} students in {elapsed:.1f}s")
+    print(f"{'route':28s} {'requests':>8s} {'errors':>7s} {'err %':>6s} {'p50 ms':>8s} {'p95 ms':>8s} "
+          f"{'p99 ms':>8s} {'max ms':>8s}")
+    for route, values in sorted(stats.latencies.items()):
+        values.sort()
+        errors = stats.errors[route]
+        print(f"{route:28s} {len(values):8d} {errors:7d} {errors / len(values) * 100:6.1f} "
+              f"{percentile(values, 0.50) * 1000:8.1f} {percentile(values, 0.95) * 1000:8.1f} "
+              f"{percentile(values, 0.99) * 1000:8.1f} {values[-1] * 1000:8.1f}")
+    for flow, count in stats.flow_errors.most_common():
+        print(f"flow error: {flow} x{count}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--timer", type=float, default=300, help="quiz timer in seconds, as in quiz()")
+    parser.add_argument("--ramp", type=float, default=60, help="seconds over which students arrive")
+    parser.add_argument("--early", type=float, default=0.2, help="fraction submitting before the timer")
+    parser.add_argument("--time-scale", type=float, default=0.1)
+    parser.add_argument("--serve", nargs=2, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(*args.serve)
+        return
+
+    tmp = tempfile.mkdtemp()
+    process, base, fake = start_server(tmp)
+    try:
+        report(*run_cohort(args, base, fake), args.users)
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"server log: {os.path.join(tmp, 'server.log')}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,74 @@
+"""Local stand-in for Google's OAuth endpoints, for load tests
+
+Implements just enough of the authorization code flow for flask_dance's
+google blueprint: the authorization endpoint redirects straight back with a
+code, the token endpoint trades it for a bearer token, and the userinfo
+endpoint describes the user.  Which user logs in is picked per browser by
+visiting ``/as?email=...`` first, which sets a cookie on the provider.
+
+``point_blueprint_at`` rewires a blueprint made by make_google_blueprint to
+this provider; the app must also run with OAUTHLIB_INSECURE_TRANSPORT=1 since
+everything is plain http.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from flask import Flask, abort, jsonify, redirect, request
+
+SCOPE = [
+    "openid",
+    "https://www.googleapis.com/auth/userinfo.email",
+    "https://www.googleapis.com/auth/userinfo.profile"
+]
+
+
+def create_fake_google():
+    app = Flask("fake_google")
+
+    @app.route("/as")
+    def login_as():
+        response = jsonify({"email": request.args["email"]})
+        response.set_cookie("fake_google_user", request.args["email"])
+        return response
+
+    @app.route("/o/oauth2/auth")
+    def authorize():
+        email = request.cookies.get("fake_google_user")
+        if not email:
+            abort(400)
+        query = urlencode({"code": email, "state": request.args.get("state", "")})
+        return redirect(f"{request.args['redirect_uri']}?{query}")
+
+    @app.route("/token", methods=["POST"])
+    def token():
+        email = request.form.get("code")
+        if not email:
+            abort(400)
+        return jsonify({
+            "access_token": f"token-{email}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "scope": " ".join(SCOPE)
+        })
+
+    @app.route("/oauth2/v2/userinfo")
+    def userinfo():
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Bearer token-"):
+            abort(401)
+        email = auth[len("Bearer token-"):]
+        return jsonify({
+            "id": hashlib.sha1(email.encode()).hexdigest()[:20],
+            "email": email,
+            "name": email.split("@")[0].replace(".", " ").title(),
+            "picture": None
+        })
+
+    return app
+
+
+def point_blueprint_at(blueprint, base):
+    """Send a google blueprint's OAuth traffic to the fake provider at ``base``"""
+    blueprint.base_url = f"{base}/"
+    blueprint.authorization_url = f"{base}/o/oauth2/auth"
+    blueprint.token_url = f"{base}/token"
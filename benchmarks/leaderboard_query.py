@@ -0,0 +1,141 @@
+"""Leaderboard query plans and latency before and after the participant indexes
+
+Builds a throwaway SQLite database with the participant table, fills it with
+synthetic rows, then times the leaderboard queries without indexes and again
+after running the index migration.
+
+    python benchmarks/leaderboard_query.py [--rows 100000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from migrations import (add_participant_leaderboard_indexes, add_participant_leaderboard_seq,  # noqa: E402
+                        run_migrations)
+
+SCHEMA = """
+CREATE TABLE participant (
+    id INTEGER PRIMARY KEY,
+    google_id VARCHAR(150) UNIQUE,
+    name VARCHAR(150),
+    email VARCHAR(150) UNIQUE,
+    profile_pic VARCHAR(300),
+    urn VARCHAR(50),
+    crn VARCHAR(50),
+    branch VARCHAR(50),
+    year INTEGER,
+    quiz_submitted BOOLEAN,
+    score INTEGER,
+    answers JSON,
+    questions JSON,
+    category_scores JSON,
+    created_at DATETIME,
+    updated_at DATETIME,
+    leaderboard_seq BIGINT
+)
+"""
+
+QUERIES = {
+    "leaderboard": (
+        "SELECT id, name, score, created_at FROM participant "
+        "WHERE quiz_submitted = 1 ORDER BY score DESC, created_at LIMIT 100",
+        {}
+    ),
+    "sync": (
+        "SELECT id, name, score, leaderboard_seq FROM participant "
+        "WHERE quiz_submitted = 1 AND leaderboard_seq > :watermark",
+        None  # Filled in with a watermark near the newest row
+    ),
+}
+
+
+def populate(engine, rows):
+    start = datetime(2025, 1, 1)
+    batch = []
+    seq = 0
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+        for i in range(rows):
+            created = start + timedelta(seconds=i)
+            submitted = random.random() < 0.9
+            seq += submitted
+            batch.append({
+                "id": i + 1,
+                "google_id": f"g{i}",
+                "name": f"Participant {i}",
+                "email": f"p{i}@example.com",
+                "submitted": submitted,
+                "score": random.randint(0, 6),
+                "category_scores": '{"Math": 2, "Reasoning": 2, "Verbal": 2}',
+                "created_at": created,
+                "updated_at": created + timedelta(minutes=5),
+                "leaderboard_seq": seq if submitted else None,
+            })
+            if len(batch) == 5000:
+                insert(conn, batch)
+                batch = []
+        if batch:
+            insert(conn, batch)
+    return max(seq - 50, 0)
+
+
+def insert(conn, batch):
+    conn.execute(text(
+        "INSERT INTO participant (id, google_id, name, email, quiz_submitted, score, category_scores, "
+        "created_at, updated_at, leaderboard_seq) VALUES (:id, :google_id, :name, :email, :submitted, :score, "
+        ":category_scores, :created_at, :updated_at, :leaderboard_seq)"
+    ), batch)
+
+
+def measure(engine, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+            timings = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - t0) * 1000)
+            results[name] = (plan, statistics.median(timings), max(timings))
+    return results
+
+
+def report(label, results):
+    print(f"\n== {label} ==")
+    for name, (plan, median, worst) in results.items():
+        print(f"{name}: median {median:.2f} ms, max {worst:.2f} ms")
+        for step in plan:
+            print(f"    {step}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        watermark = populate(engine, args.rows)
+        QUERIES["sync"] = (QUERIES["sync"][0], {"watermark": watermark})
+        print(f"{args.rows} participants")
+
+        report("before indexes", measure(engine, args.repeat))
+        run_migrations(engine, [add_participant_leaderboard_indexes, add_participant_leaderboard_seq])
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        report("after indexes", measure(engine, args.repeat))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Quiz start latency: a whole hall opening the quiz at once
+
+Creates participants, then has them all GET /quiz together (which draws and
+renders their papers), once with the question fragment cache disabled and
+once with it enabled.  A synthetic bank gives each paper enough questions for
+rendering to matter.
+
+    python benchmarks/quiz_start.py [--users 300] [--questions 300] [--paper any:10]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp()
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP, 'participants.db')}"
+os.environ["SESSION_BACKEND"] = "memory"
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import logging  # noqa: E402
+
+import main  # noqa: E402
+from fragments import FragmentCache  # noqa: E402
+from question_bank import QuestionBank  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def synthetic_bank(size):
+    path = os.path.join(TMP, "questions.json")
+    questions = []
+    for i in range(1, size + 1):
+        options = [f"Option {j} of question {i}" for j in range(4)]
+        questions.append({
+            "id": i,
+            "category": ("Math", "Reasoning", "Verbal")[i % 3],
+            "question": f"Question {i}: which of the following is right?",
+            "options": options,
+            "answer": options[i % 4]
+        })
+    with open(path, "w") as f:
+        json.dump(questions, f)
+    return QuestionBank(path)
+
+
+def prepare(prefix, users):
+    clients = []
+    with main.app.app_context():
+        for i in range(users):
+            email = f"{prefix}{i}@example.com"
+            main.db.session.add(main.Participant(google_id=email, name=f"User {i}", email=email,
+                                                 branch="CSE", year=2, urn=str(i)))
+            client = main.app.test_client()
+            with client.session_transaction() as session:
+                session["user_email"] = email
+                session["user_name"] = f"User {i}"
+                session["user_picture"] = None
+                session["google_id"] = email
+            clients.append(client)
+        main.db.session.commit()
+    return clients
+
+
+def start_together(clients):
+    barrier = threading.Barrier(len(clients))
+    latencies = []
+    failures = []
+
+    def start(client):
+        barrier.wait()
+        t0 = time.perf_counter()
+        response = client.get("/quiz")
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            failures.append(response.status_code)
+
+    threads = [threading.Thread(target=start, args=(client,)) for client in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), failures
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--paper", default="any:10")
+    args = parser.parse_args()
+
+    main.question_bank = synthetic_bank(args.questions)
+    main.app.config["QUIZ_PAPER"] = args.paper
+
+    for label, cache_size in (("no fragment cache", 0), ("fragment cache", 5000)):
+        main.quiz_fragments = FragmentCache(cache_size)
+        latencies, failures = start_together(prepare(label.replace(" ", "-"), args.users))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{label}: p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms, failed {len(failures)}, "
+              f"fragments {main.quiz_fragments.misses} rendered / {main.quiz_fragments.hits} reused")
+
+
+if __name__ == "__main__":
+    run()
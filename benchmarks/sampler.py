@@ -0,0 +1,66 @@
+"""Paper sampling speed on large question banks
+
+Builds a synthetic bank (three categories, three difficulty tiers) and times
+drawing papers with and without a set of previously seen questions to avoid.
+Also checks that a seed regenerates the same paper.
+
+    python benchmarks/sampler.py [--questions 50000] [--draws 10000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from question_bank import parse_bank  # noqa: E402
+from sampler import Sampler, parse_spec  # noqa: E402
+
+
+def synthetic_bank(size):
+    questions = []
+    for i in range(1, size + 1):
+        options = [f"Option {j}" for j in range(4)]
+        questions.append({
+            "id": i,
+            "category": ("Math", "Reasoning", "Verbal")[i % 3],
+            "difficulty": ("easy", "medium", "hard")[i // 3 % 3],
+            "question": f"Question {i}",
+            "options": options,
+            "answer": options[i % 4]
+        })
+    return parse_bank(json.dumps(questions).encode())
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=50000)
+    parser.add_argument("--draws", type=int, default=10000)
+    parser.add_argument("--spec", default="easy:3,medium:4,hard:3")
+    args = parser.parse_args()
+
+    bank = synthetic_bank(args.questions)
+    spec = parse_spec(args.spec)
+
+    start = time.perf_counter()
+    sampler = Sampler(bank)
+    print(f"build: {(time.perf_counter() - start) * 1000:.1f} ms for {len(bank)} questions")
+
+    for label, exclude in (("no history", ()), ("500 seen", random.sample(range(1, len(bank) + 1), 500))):
+        exclude = set(exclude)
+        start = time.perf_counter()
+        for seed in range(args.draws):
+            question_ids, _ = sampler.draw(seed, spec, exclude)
+        elapsed = time.perf_counter() - start
+        assert not exclude & set(question_ids)
+        print(f"draw ({label}): {elapsed / args.draws * 1e6:.1f} us per paper of {len(question_ids)} questions")
+
+    assert sampler.draw(42, spec) == Sampler(bank).draw(42, spec), "seeded draws must be reproducible"
+    print("seeded draws are reproducible")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,84 @@
+"""Request throughput of each session backend
+
+Runs a minimal Flask app under every SESSION_BACKEND with the same access
+pattern as the real routes: a login that stores the user's details, then page
+loads that read them and pop ``_flashes``.  Several threads drive their own
+test clients concurrently.
+
+    python benchmarks/session_backends.py [--users 8] [--requests 500]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from flask import Flask, session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sessions import init_sessions  # noqa: E402
+
+BACKENDS = ["filesystem", "memory", "sqlite", "cookie"]
+
+
+def make_app(backend, tmp):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY="bench",
+        SESSION_BACKEND=backend,
+        SESSION_TYPE="filesystem",
+        SESSION_FILE_DIR=os.path.join(tmp, "flask_session"),
+        SESSION_SQLITE_PATH=os.path.join(tmp, "sessions.db"),
+    )
+    init_sessions(app)
+
+    @app.route("/login/<int:user>")
+    def login(user):
+        session["user_email"] = f"user{user}@example.com"
+        session["user_name"] = f"User {user}"
+        session["user_picture"] = "https://example.com/avatar.png"
+        session["google_id"] = str(100000 + user)
+        return "ok"
+
+    @app.route("/page")
+    def page():
+        session.pop("_flashes", None)
+        return session.get("user_name", "")
+
+    return app
+
+
+def run(backend, users, requests):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(backend, tmp)
+
+        def worker(user):
+            client = app.test_client()
+            client.get(f"/login/{user}")
+            for _ in range(requests):
+                assert client.get("/page").data == f"User {user}".encode()
+
+        threads = [threading.Thread(target=worker, args=(u,)) for u in range(users)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    return users * (requests + 1) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{args.users} concurrent users x {args.requests} page loads")
+    for backend in BACKENDS:
+        print(f"{backend:>10}: {run(backend, args.users, args.requests):8.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
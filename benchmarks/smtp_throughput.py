@@ -0,0 +1,98 @@
+"""Results email throughput: one connection per message vs BatchMailer
+
+Starts a local fake SMTP server that accepts and discards mail, optionally
+sleeping on each new connection to stand in for the TCP + TLS handshake and
+login of a real provider, and sends the same messages both ways.
+
+    python benchmarks/smtp_throughput.py [--messages 500] [--handshake-ms 150]
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask  # noqa: E402
+from flask_mail import Mail, Message  # noqa: E402
+
+from mailer import BatchMailer  # noqa: E402
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib to deliver a message"""
+
+    handshake = 0.0
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        time.sleep(self.handshake)
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif command.startswith("DATA"):
+                self.reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.reply("250 queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 ok")
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def messages(count):
+    body = "<p>Your Score: 6</p>" * 50
+    for i in range(count):
+        yield i, Message("Your Aptitude Quiz Results", recipients=[f"user{i}@example.com"], html=body)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--handshake-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    SMTPSink.handshake = args.handshake_ms / 1000
+    server = Server(("127.0.0.1", 0), SMTPSink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=server.server_address[1], MAIL_USE_TLS=False,
+                      MAIL_USE_SSL=False, MAIL_DEFAULT_SENDER="club@example.com")
+    mail = Mail(app)
+
+    with app.app_context():
+        start = time.perf_counter()
+        for _, message in messages(args.messages):
+            mail.send(message)
+        per_message = time.perf_counter() - start
+
+        start = time.perf_counter()
+        errors = sum(error is not None for _, error in BatchMailer(mail).send_all(messages(args.messages)))
+        batched = time.perf_counter() - start
+
+    server.shutdown()
+    print(f"connection per message: {args.messages / per_message:.1f} msgs/s")
+    print(f"batched connection:     {args.messages / batched:.1f} msgs/s ({errors} errors)")
+
+
+if __name__ == "__main__":
+    run()
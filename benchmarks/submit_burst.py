@@ -0,0 +1,115 @@
+"""Simultaneous auto-submit load test
+
+Reproduces the end of an exam: every participant's timer hits zero at once and
+quiz_timer.js posts the quiz with ``time_up=true``.  Runs the real app against
+a throwaway SQLite database: grading inside the request (GRADING_WORKERS=0),
+then accepting submissions and grading them in the worker pool, with direct
+commits and with GROUP_COMMIT.  Reports submit latency, failures, how long
+until every submission was graded, and how many reached the database.
+
+    python benchmarks/submit_burst.py [--users 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp()
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP, 'participants.db')}"
+os.environ["SESSION_BACKEND"] = "memory"
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import logging  # noqa: E402
+
+import main  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def prepare(prefix, users):
+    """Create participants with open attempts and logged-in clients"""
+    clients = []
+    with main.app.app_context():
+        bank = main.question_bank.get()
+        for i in range(users):
+            email = f"{prefix}{i}@example.com"
+            participant = main.Participant(google_id=email, name=f"User {i}", email=email,
+                                           branch="CSE", year=2, urn=str(i))
+            main.db.session.add(participant)
+            main.db.session.commit()
+            attempt = main.new_attempt(participant, bank)
+            form = {"time_up": "true", "answers_included": "1"}
+            for qid in main.attempt_paper(attempt)[1]:
+                form[f"q{qid}"] = random.choice(bank.by_id[qid].options)
+
+            client = main.app.test_client()
+            with client.session_transaction() as session:
+                session["user_email"] = email
+                session["user_name"] = f"User {i}"
+                session["user_picture"] = None
+                session["google_id"] = email
+            clients.append((client, form))
+    return clients
+
+
+def burst(clients):
+    barrier = threading.Barrier(len(clients))
+    latencies = []
+    failures = []
+
+    def submit(client, form):
+        barrier.wait()
+        t0 = time.perf_counter()
+        response = client.post("/quiz", data=form)
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 302 or not response.location.endswith("/thank_you"):
+            failures.append(response.location)
+
+    threads = [threading.Thread(target=submit, args=item) for item in clients]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, sorted(latencies), failures
+
+
+def report(label, prefix, started, elapsed, latencies, failures):
+    main.grading_pool.join()
+    graded_after = time.perf_counter() - started
+    with main.app.app_context():
+        stored = (main.Participant.query
+                  .filter(main.Participant.email.like(f"{prefix}%"), main.Participant.quiz_submitted.is_(True))
+                  .count())
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label}: {len(latencies)} submits in {elapsed:.2f}s, "
+          f"p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+          f"max {latencies[-1] * 1000:.0f} ms, failed {len(failures)}, all graded after {graded_after:.2f}s, "
+          f"stored {stored}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    modes = (("graded in the request", "inline", False, 0),
+             ("accepted, direct commits", "direct", False, main.grading_pool.workers),
+             ("accepted, group commit", "group", True, main.grading_pool.workers))
+    for label, prefix, group_commit, grading_workers in modes:
+        main.app.config["GROUP_COMMIT"] = group_commit
+        main.app.config["GRADING_WORKERS"] = grading_workers
+        clients = prepare(prefix, args.users)
+        started = time.perf_counter()
+        report(label, prefix, started, *burst(clients))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,105 @@
+"""Streaming result exports
+
+Rows arrive in batches (lists of tuples) and each writer yields encoded bytes
+as soon as a batch is written, so a response never holds more than one batch.
+CSV needs nothing extra; Parquet and Arrow need pyarrow, which is imported only
+when one of those formats is requested.
+"""
+import csv
+import io
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+class ExportUnavailable(Exception):
+    """The requested format needs an optional dependency that is missing"""
+
+
+# Leading characters spreadsheets read as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value):
+    """Quote user-supplied text that a spreadsheet would otherwise evaluate as a formula"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(columns, batches):
+    # Only text columns hold user input; numbers such as a negative score stay numbers
+    text_columns = [i for i, (_, kind) in enumerate(columns) if kind == "str"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for batch in batches:
+        for row in batch:
+            row = list(row)
+            for i in text_columns:
+                row[i] = csv_cell(row[i])
+            writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def arrow_schema(columns):
+    """Map ("name", kind) columns to a pyarrow schema; kind is int, str or datetime"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ExportUnavailable("Parquet and Arrow exports need pyarrow installed")
+    types = {"int": pa.int64(), "str": pa.string(), "datetime": pa.timestamp("us")}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def arrow_chunks(columns, batches, fmt="parquet"):
+    """Write batches as Parquet row groups or Arrow IPC record batches"""
+    import pyarrow as pa
+
+    schema = arrow_schema(columns)
+    sink = _Sink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for batch in batches:
+        if not batch:
+            continue
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
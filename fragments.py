@@ -0,0 +1,44 @@
+"""Rendered template fragment cache
+
+Quiz pages are assembled from per-question fragments.  A fragment depends
+only on the bank version, the question and its option order, so every
+participant who gets the same question in the same order shares one rendered
+copy, and a hall starting the quiz together renders each fragment once.
+"""
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """Bounded LRU of rendered fragments; ``max_entries=0`` disables caching"""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """Return the fragment cached under ``key``, calling ``render()`` on a miss"""
+        if not self.max_entries:
+            return render()
+        with self._lock:
+            fragment = self._data.get(key)
+            if fragment is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        # Render outside the lock; concurrent misses for one key render it twice at worst
+        fragment = render()
+        with self._lock:
+            self._data[key] = fragment
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return fragment
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,86 @@
+"""Grading engine
+
+Each question's answer key is compiled once per bank snapshot into an option
+bitmask: bit ``i`` is set when option ``i`` (in bank order) is correct.  A
+response is encoded the same way, so grading is a single integer comparison
+per question and a whole cohort can be scored as one NumPy expression.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+
+class AnswerKey:
+    """Compiled answer key for one question bank snapshot"""
+
+    def __init__(self, bank):
+        self.version = bank.version
+        self.categories = bank.categories
+        self.question_ids = tuple(q.id for q in bank.questions)
+        self.column = {qid: i for i, qid in enumerate(self.question_ids)}
+
+        self._option_bits = {}
+        self._multiple = {}
+        keys = np.zeros(len(self.question_ids), dtype=np.uint32)
+        category_matrix = np.zeros((len(self.question_ids), len(self.categories)), dtype=np.int32)
+        category_column = {c: i for i, c in enumerate(self.categories)}
+
+        for i, q in enumerate(bank.questions):
+            bits = {option: 1 << n for n, option in enumerate(q.options)}
+            answers = q.answer if q.multiple else (q.answer,)
+            keys[i] = sum(bits[a] for a in set(answers))
+            category_matrix[i, category_column[q.category]] = 1
+            self._option_bits[q.id] = bits
+            self._multiple[q.id] = q.multiple
+
+        self.keys = keys
+        self.category_matrix = category_matrix
+
+    def encode(self, question_id, choices):
+        """Encode the chosen option texts for one question as a bitmask"""
+        bits = self._option_bits.get(question_id)
+        if not bits or not choices:
+            return 0
+        if not self._multiple[question_id]:
+            choices = choices[:1]
+        mask = 0
+        for choice in choices:
+            mask |= bits.get(choice, 0)
+        return mask
+
+    def encode_row(self, answers):
+        """Encode a {question_id: [choices]} mapping as one row of masks"""
+        row = np.zeros(len(self.question_ids), dtype=np.uint32)
+        for qid, choices in answers.items():
+            col = self.column.get(int(qid))
+            if col is not None:
+                row[col] = self.encode(int(qid), choices)
+        return row
+
+    def is_correct(self, question_id, choices):
+        """Check one answer against the key"""
+        col = self.column.get(question_id)
+        if col is None:
+            return False
+        return self.encode(question_id, choices) == int(self.keys[col])
+
+    def score(self, answers):
+        """Score one submission, returning (total, {category: score})"""
+        totals, by_category = self.score_batch(self.encode_row(answers)[np.newaxis, :])
+        return int(totals[0]), {c: int(s) for c, s in zip(self.categories, by_category[0])}
+
+    def score_batch(self, masks):
+        """Score an (n_submissions, n_questions) array of masks in one pass
+
+        Columns follow ``question_ids``.  Questions that were not asked or not
+        answered hold 0, which never matches a key.  Returns the totals as an
+        (n,) array and the per-category scores as an (n, n_categories) array.
+        """
+        correct = (np.asarray(masks, dtype=np.uint32) == self.keys).astype(np.int32)
+        return correct.sum(axis=1), correct @ self.category_matrix
+
+
+@lru_cache(maxsize=4)
+def compile_key(bank):
+    """Compile (and cache) the answer key for a bank snapshot"""
+    return AnswerKey(bank)
@@ -0,0 +1,129 @@
+"""Helpers for the database-backed job queues
+
+Jobs themselves are rows in the database: email_job for results emails, and
+accepted but ungraded quiz_attempt rows for grading (see main.py).  Every
+worker process ticks the dispatchers, but only the one holding ``ProcessLock``
+does any work, so jobs are dispatched by a single process at a time and a
+crashed holder's lock is released by the OS for the next tick to pick up.
+``BatchWorkerPool`` handles work a process queued itself straight away, in
+batches, leaving the periodic sweeps to catch whatever it lost.
+"""
+import logging
+import os
+import queue
+import threading
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to per-job claims only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessLock:
+    """Non-blocking, process-lifetime file lock"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def acquire(self):
+        """Return True if this process holds the lock, taking it if it is free"""
+        if self._fh is not None:
+            return True
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fh = open(self.path, "a")
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._fh = fh
+        logger.info(f"Process {os.getpid()} is now the job dispatcher")
+        return True
+
+
+def retry_delay(attempts, base=60, cap=3600):
+    """Exponential backoff: 1, 2, 4, ... minutes, capped at an hour"""
+    return timedelta(seconds=min(cap, base * 2 ** max(0, attempts - 1)))
+
+
+class BatchWorkerPool:
+    """Worker threads handling queued items in batches
+
+    ``submit(item)`` queues an item; a free worker takes everything waiting,
+    up to ``max_batch`` items, and passes the list to ``handler`` inside an
+    app context.  If a batch fails, each of its items is retried on its own so
+    one bad item cannot sink the others; an item that still fails is passed to
+    ``on_failure(item, error)`` and dropped, so items must also be recoverable
+    from the database.  Threads start on the first submit.
+    """
+
+    def __init__(self, app, handler, workers=2, max_batch=200, max_wait=0.01, name="batch", on_failure=None):
+        self.app = app
+        self.handler = handler
+        self.on_failure = on_failure
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        self._queue.put(item)
+        self._ensure_threads()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Block until every item submitted so far was handled"""
+        self._queue.join()
+
+    def _ensure_threads(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            try:
+                self._handle(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _handle(self, batch):
+        try:
+            with self.app.app_context():
+                self.handler(batch)
+            return
+        except Exception as e:
+            error = e
+        if len(batch) > 1:
+            logger.warning(f"{self.name} batch of {len(batch)} failed, retrying one by one: {str(error)}")
+            for item in batch:
+                self._handle([item])
+            return
+        logger.error(f"{self.name} item {batch[0]!r} failed: {str(error)}")
+        if self.on_failure is not None:
+            try:
+                with self.app.app_context():
+                    self.on_failure(batch[0], error)
+            except Exception as e:
+                logger.error(f"{self.name} could not record failure of {batch[0]!r}: {str(e)}")
@@ -0,0 +1,163 @@
+"""In-memory leaderboard
+
+Submitted participants are kept in a list sorted by (score desc, submit time,
+id).  Rank lookups and insert positions are found by bisection, so a new
+submission or a rank query does not touch the rest of the table, and a page of
+the leaderboard is a slice of the list.
+
+The leaderboard version is the highest change number (``seq``) it has seen.
+Change numbers are handed out by a counter row in the same transaction as the
+score they belong to, so they commit in order; they come from the database
+rather than a local counter so that every worker hands out comparable
+versions to polling clients.  Wall-clock timestamps would not do: they are
+taken before the commit, so a row committed late can carry an older one.
+"""
+import threading
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_micros(dt):
+    """Microseconds since the epoch for a naive UTC datetime"""
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class Leaderboard:
+    """Sorted, thread-safe view of submitted participants"""
+
+    def __init__(self):
+        self._keys = []      # Sorted (-score, submitted_at, id)
+        self._entries = {}   # id -> entry dict
+        self._lock = threading.RLock()
+        self.watermark = 0     # Every change up to this seq has been read from the database
+        self.synced_at = 0.0   # time.monotonic() of the last database sync
+        self._version = 0      # Highest seq applied
+        self._changes = []     # Sorted (seq, id), may hold stale pairs until compacted
+        self._score_sum = 0
+
+    @staticmethod
+    def _key(entry):
+        return (-entry["score"], to_micros(entry["submitted_at"]), entry["id"])
+
+    @staticmethod
+    def encode_cursor(key):
+        return "{}.{}.{}".format(*key)
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Parse a pagination cursor, raising ValueError if it is malformed"""
+        neg_score, submitted, pid = cursor.split(".")
+        return (int(neg_score), int(submitted), int(pid))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, entries):
+        """Replace the whole leaderboard, e.g. when rebuilding from the database"""
+        with self._lock:
+            self._entries = {e["id"]: e for e in entries}
+            self._keys = sorted(self._key(e) for e in self._entries.values())
+            self._changes = sorted((e["seq"], e["id"]) for e in self._entries.values())
+            self._score_sum = sum(e["score"] for e in self._entries.values())
+            self._version = self.watermark = max((e["seq"] for e in self._entries.values()), default=0)
+
+    def upsert(self, entry):
+        """Insert or move one participant after a submission or re-grade"""
+        with self._lock:
+            old = self._entries.get(entry["id"])
+            if old is not None:
+                if old["seq"] >= entry["seq"]:
+                    return  # Already applied, or older than what is shown
+                del self._keys[bisect_left(self._keys, self._key(old))]
+                self._score_sum -= old["score"]
+            self._entries[entry["id"]] = entry
+            insort(self._keys, self._key(entry))
+            insort(self._changes, (entry["seq"], entry["id"]))
+            self._score_sum += entry["score"]
+            self._version = max(self._version, entry["seq"])
+            if len(self._changes) > 2 * len(self._entries):
+                # Re-grades leave their old (seq, id) behind; changed_since skips those anyway
+                self._changes = sorted((e["seq"], e["id"]) for e in self._entries.values())
+
+    def sync(self, entries):
+        """Apply every change after ``watermark``, as read from the database in one query"""
+        with self._lock:
+            for entry in entries:
+                self.upsert(entry)
+                self.watermark = max(self.watermark, entry["seq"])
+
+    @property
+    def version(self):
+        """Opaque version that changes whenever an entry changes"""
+        return self._version
+
+    def stats(self):
+        """Participant count, average and top score"""
+        with self._lock:
+            count = len(self._keys)
+            return {
+                "total": count,
+                "average": self._score_sum / count if count else 0,
+                "top": -self._keys[0][0] if count else 0
+            }
+
+    def page(self, cursor=None, limit=100):
+        """A page of (rank, entry) pairs after ``cursor`` and the next cursor"""
+        with self._lock:
+            start = bisect_right(self._keys, self.decode_cursor(cursor)) if cursor else 0
+            keys = self._keys[start:start + limit]
+            rows = [(start + i + 1, self._entries[key[2]]) for i, key in enumerate(keys)]
+            more = start + limit < len(self._keys)
+            return rows, self.encode_cursor(keys[-1]) if keys and more else None
+
+    def changed_since(self, version):
+        """(rank, entry) pairs for entries updated after ``version``"""
+        with self._lock:
+            seen = set()
+            rows = []
+            for seq, pid in self._changes[bisect_right(self._changes, (version, float("inf"))):]:
+                entry = self._entries.get(pid)
+                if pid in seen or entry is None or entry["seq"] != seq:
+                    continue
+                seen.add(pid)
+                rows.append((bisect_left(self._keys, self._key(entry)) + 1, entry))
+            return rows
+
+
+class Broadcaster:
+    """Wakes every waiting stream when the leaderboard version changes
+
+    All Server-Sent Events streams of a process wait on one condition, so a
+    change is fanned out from memory however many dashboards are connected.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.version = 0
+        self.subscribers = 0
+
+    def publish(self, version):
+        with self._cond:
+            if version != self.version:
+                self.version = version
+                self._cond.notify_all()
+
+    def wait(self, version, timeout):
+        """Block until the version differs from ``version`` or the timeout passes"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @contextmanager
+    def subscribe(self):
+        with self._cond:
+            self.subscribers += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self.subscribers -= 1
@@ -0,0 +1,152 @@
+"""Batched SMTP delivery
+
+``BatchMailer`` sends many messages over one SMTP connection instead of paying
+a TCP + TLS handshake and login per email.  Sends are paced by a token bucket
+so a large cohort stays under the provider's rate limits, and each message
+succeeds or fails on its own: a refused recipient is reported for that message
+only, and a dropped connection is reopened before the next one.
+
+``MailerPool`` runs several BatchMailers on worker threads behind a bounded
+queue, for bulk sends where rendering should not wait on the network.
+"""
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` events per second with bursts of ``burst``"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                time.sleep((1 - self._tokens) / self.rate)
+                self._updated = time.monotonic()
+                self._tokens = 0
+            else:
+                self._tokens -= 1
+
+
+class BatchMailer:
+    """Sends messages through one reused Flask-Mail connection"""
+
+    def __init__(self, mail, rate_limiter=None):
+        self.mail = mail
+        self.rate_limiter = rate_limiter
+
+    def send_all(self, messages):
+        """Send (key, message) pairs, yielding (key, error) for each
+
+        ``error`` is None when the message was accepted by the server.  Must be
+        called inside an app context.
+        """
+        connection = None
+        try:
+            for key, message in messages:
+                if self.rate_limiter:
+                    self.rate_limiter.wait()
+                for retry in (True, False):
+                    try:
+                        if connection is None:
+                            connection = self.mail.connect().__enter__()
+                        connection.send(message)
+                        error = None
+                    except smtplib.SMTPServerDisconnected as e:
+                        # Idle connections get dropped; reconnect and retry once
+                        self._close(connection)
+                        connection = None
+                        error = e
+                        if retry:
+                            continue
+                    except smtplib.SMTPException as e:
+                        # Refused recipient or data: the connection is still usable
+                        error = e
+                    except OSError as e:
+                        self._close(connection)
+                        connection = None
+                        error = e
+                    except Exception as e:
+                        error = e
+                    break
+                yield key, error
+        finally:
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        if connection is None or connection.host is None:
+            return
+        try:
+            connection.host.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.host.close()
+
+
+_STOP = object()
+
+
+class MailerPool:
+    """Worker threads each sending over their own SMTP connection
+
+    ``submit`` blocks once ``queue_size`` messages are waiting, so a producer
+    streaming from the database never holds more than that in memory.
+    ``wait`` blocks until everything submitted so far was sent and returns the
+    (key, error) results since the previous call.
+    """
+
+    def __init__(self, app, mail, workers=4, rate_limiter=None, queue_size=None):
+        self.app = app
+        self.mail = mail
+        self.rate_limiter = rate_limiter
+        self._queue = queue.Queue(maxsize=queue_size or workers * 10)
+        self._results = queue.Queue()
+        self._threads = [threading.Thread(target=self._run, name=f"mailer-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, message):
+        self._queue.put((key, message))
+
+    def wait(self):
+        self._queue.join()
+        results = []
+        while not self._results.empty():
+            results.append(self._results.get())
+        return results
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _messages(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            yield item
+
+    def _run(self):
+        with self.app.app_context():
+            for result in BatchMailer(self.mail, self.rate_limiter).send_all(self._messages()):
+                self._results.put(result)
+                self._queue.task_done()
@@ -1,13 +1,38 @@
-from flask import Flask, redirect, url_for, session, render_template, request, flash, jsonify, abort
-from flask_dance.contrib.google import make_google_blueprint, google
+from flask import Flask, redirect, url_for, session, render_template, request, flash, jsonify, abort, Response, g, stream_with_context
+from flask_dance.consumer import OAuth2ConsumerBlueprint
 from flask_sqlalchemy import SQLAlchemy
-from flask_session import Session
+from werkzeug.local import LocalProxy
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 import random
 import logging
 from datetime import datetime, timedelta
 from flask_mail import Message, Mail
 from apscheduler.schedulers.background import BackgroundScheduler
 import os
+from question_bank import QuestionBank
+from migrations import run_migrations
+from sessions import init_sessions
+from storage import GroupCommitter, configure_sqlite, engine_options
+from jobs import BatchWorkerPool, ProcessLock, retry_delay
+from mailer import BatchMailer, MailerPool, RateLimiter
+from grading import compile_key
+from sampler import SAMPLER_VERSION, check_stream, compile_sampler, parse_spec
+from fragments import FragmentCache
+from attempts import decode_answers, deserialize_bank, encode_answers, serialize_bank
+from leaderboard import Leaderboard, Broadcaster
+from analytics import count_submissions, summarize as summarize_analytics
+from export import FORMATS as EXPORT_FORMATS, ExportUnavailable, arrow_chunks, arrow_schema, csv_chunks
+from metrics import Registry, instrument_app
+from profiling import KINDS as PROFILE_KINDS, RequestProfiler
+import hmac
+import json
+import threading
+from collections import Counter
+import time
+from typing import NamedTuple
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,23 +43,73 @@ app = Flask(__name__)
 # Configuration
 app.config.update(
     SECRET_KEY=os.getenv('SECRET_KEY'),
+    SESSION_BACKEND=os.getenv('SESSION_BACKEND', 'filesystem'),  # filesystem, memory, sqlite or cookie
     SESSION_TYPE="filesystem",
-    SQLALCHEMY_DATABASE_URI="sqlite:///participants.db",
+    SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', "sqlite:///participants.db"),
+    SQLALCHEMY_ENGINE_OPTIONS=engine_options(os.getenv('DATABASE_URL', "sqlite:///participants.db")),
+    GROUP_COMMIT=os.getenv('GROUP_COMMIT', '0') == '1',  # Batch quiz submissions into shared transactions
     SQLALCHEMY_TRACK_MODIFICATIONS=False,
     MAIL_SERVER='smtp.gmail.com',
     MAIL_PORT=587,
     MAIL_USE_TLS=True,
     MAIL_USERNAME=os.getenv('MAIL_USERNAME'),
     MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
-    MAIL_DEFAULT_SENDER=os.getenv('MAIL_DEFAULT_SENDER')
+    MAIL_DEFAULT_SENDER=os.getenv('MAIL_DEFAULT_SENDER'),
+    PARTICIPANT_CACHE_TTL=float(os.getenv('PARTICIPANT_CACHE_TTL', 5)),
+    MAIL_RATE_LIMIT=float(os.getenv('MAIL_RATE_LIMIT', 5)),  # Messages per second, 0 for no limit
+    BULK_EMAIL_WORKERS=int(os.getenv('BULK_EMAIL_WORKERS', 4)),  # SMTP connections for "email all results"
+    QUIZ_PAPER=os.getenv('QUIZ_PAPER', 'any:2'),  # Questions per category by difficulty, e.g. easy:1,hard:1
+    QUIZ_FRAGMENT_CACHE=int(os.getenv('QUIZ_FRAGMENT_CACHE', 5000)),  # Rendered questions kept, 0 to disable
+    GRADING_WORKERS=int(os.getenv('GRADING_WORKERS', 2)),  # Threads grading accepted submissions, 0 to grade in the request
+    METRICS_TOKEN=os.getenv('METRICS_TOKEN'),  # Bearer token letting a scraper read /metrics without logging in
+    PROFILE_SAMPLE_RATE=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),  # Fraction of PROFILE_ENDPOINTS requests profiled
+    PROFILE_ENDPOINTS=os.getenv('PROFILE_ENDPOINTS', 'quiz,leaderboard_data'),
+    PROFILE_KIND=os.getenv('PROFILE_KIND', 'cprofile'),  # cprofile or sample
+    PROFILE_KEEP=int(os.getenv('PROFILE_KEEP', 20))  # Profiles held in memory for /admin/profiles
 )
 
 # Initialize extensions
-Session(app)
+init_sessions(app)
 db = SQLAlchemy(app)
 mail = Mail(app)
 
 # Google OAuth Configuration
+class RequestScopedOAuth2Blueprint(OAuth2ConsumerBlueprint):
+    """OAuth2 blueprint that builds its provider session once per request
+
+    flask_dance caches one requests session on the blueprint and loads the
+    current user's token into it before each call, so on a threaded server
+    concurrent logins can pick up each other's tokens.
+    """
+
+    @property
+    def session(self):
+        key = f"oauth_session_{self.name}"
+        if key not in g:
+            setattr(g, key, OAuth2ConsumerBlueprint.session.fget(self))
+        return g.get(key)
+
+    @session.deleter
+    def session(self):
+        g.pop(f"oauth_session_{self.name}", None)
+
+def make_google_blueprint(client_id, client_secret, scope, redirect_to):
+    """The Google blueprint flask_dance.contrib.google builds, with a per-request session"""
+    blueprint = RequestScopedOAuth2Blueprint(
+        "google",
+        __name__,
+        client_id=client_id,
+        client_secret=client_secret,
+        scope=scope,
+        base_url="https://www.googleapis.com/",
+        authorization_url="https://accounts.google.com/o/oauth2/auth",
+        token_url="https://accounts.google.com/o/oauth2/token",
+        redirect_to=redirect_to,
+    )
+    blueprint.from_config["client_id"] = "GOOGLE_OAUTH_CLIENT_ID"
+    blueprint.from_config["client_secret"] = "GOOGLE_OAUTH_CLIENT_SECRET"
+    return blueprint
+
 google_bp = make_google_blueprint(
     client_id=os.getenv("GOOGLE_CLIENT_ID"),
     client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
@@ -46,6 +121,7 @@ google_bp = make_google_blueprint(
     redirect_to="google_login"
 )
 app.register_blueprint(google_bp, url_prefix="/login")
+google = LocalProxy(lambda: google_bp.session)  # As flask_dance.contrib.google.google, for this request
 
 # Database Model
 class Participant(db.Model):
@@ -60,20 +136,296 @@ class Participant(db.Model):
     year = db.Column(db.Integer)
     quiz_submitted = db.Column(db.Boolean, default=False)
     score = db.Column(db.Integer, default=0)
-    answers = db.Column(db.JSON, nullable=True)
-    questions = db.Column(db.JSON, nullable=True)  # Store the questions that were asked
+    leaderboard_seq = db.Column(db.BigInteger, nullable=True, index=True)  # Change number of the last score update
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class QuizAttempt(db.Model):
+    """The paper a participant was given, fixed when the quiz page is first served"""
+    id = db.Column(db.Integer, primary_key=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey("participant.id"), nullable=False, index=True)
+    bank_version = db.Column(db.String(12))
+    seed = db.Column(db.BigInteger, nullable=True)  # Sampler seed; with bank_version and paper_spec it regenerates the paper
+    paper_spec = db.Column(db.String(100), nullable=True)
+    sampler_version = db.Column(db.Integer, nullable=True)  # SAMPLER_VERSION that drew the paper from the seed
+    # Stored only when the paper cannot be regenerated from the seed (empty otherwise)
+    question_ids = db.Column(db.JSON, nullable=False)  # Question ids in display order
+    option_orders = db.Column(db.JSON, nullable=False)  # Per question, bank option indexes in display order
+    answer_bits = db.Column(db.LargeBinary, nullable=True)  # Answer bitmap, see attempts.py
+    answers = db.Column(db.JSON, nullable=True)  # Attempts submitted before answer_bits: {question_id: [chosen options]}
     category_scores = db.Column(db.JSON, nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    submitted_at = db.Column(db.DateTime, nullable=True)  # Answers accepted
+    graded_at = db.Column(db.DateTime, nullable=True)  # Scored; participant.score and the leaderboard updated
+    grading_failures = db.Column(db.Integer, default=0, server_default="0", nullable=False)  # Sweep gives up at GRADING_MAX_FAILURES
+    grading_error = db.Column(db.String(500), nullable=True)
+    __table_args__ = (db.Index("ix_quiz_attempt_grading", "graded_at", "submitted_at"),)
+
+class AnswerSave(db.Model):
+    """One autosaved batch of answer changes for an open attempt; rows are only ever appended"""
+    id = db.Column(db.Integer, primary_key=True)
+    attempt_id = db.Column(db.Integer, db.ForeignKey("quiz_attempt.id"), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # Batch number from the quiz page; later batches win
+    answers = db.Column(db.JSON, nullable=False)  # {question_id: [chosen options]} changed in this batch
+    saved_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint("attempt_id", "seq", name="uq_answer_save_attempt_seq"),)
+
+class QuestionBankArchive(db.Model):
+    """Every question bank version attempts were drawn from, compressed"""
+    version = db.Column(db.String(12), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EmailJob(db.Model):
+    """A results email waiting to be sent; holds only the participant id"""
+    id = db.Column(db.Integer, primary_key=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey("participant.id"), nullable=False, index=True)
+    status = db.Column(db.String(20), default="pending", nullable=False)  # pending, running, sent, failed
+    run_at = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (db.Index("ix_email_job_due", "status", "run_at"),)
+
+class AnalyticsCounter(db.Model):
+    """One named analytics counter, bumped on every submission (see analytics.py)"""
+    name = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
 
-# Create database tables
+class VersionCounter(db.Model):
+    """A named change counter; bumping it locks the row until commit, so its values commit in order"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+
+class BulkEmailRun(db.Model):
+    """Progress of an "email all results" run, resumable from ``cursor``"""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default="running", nullable=False)  # running, done, failed
+    cursor = db.Column(db.Integer, default=0, nullable=False)  # Participants up to this id are handled
+    total = db.Column(db.Integer, default=0, nullable=False)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    sent = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.String(500), nullable=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+# Create database tables and bring older databases up to date
 with app.app_context():
+    configure_sqlite(db.engine)
     db.create_all()
+    run_migrations(db.engine)
+
+# Per-endpoint request, query and session timings, served at /metrics
+metrics_registry = Registry()
+with app.app_context():
+    instrument_app(app, db.engine, metrics_registry)
+
+# Question bank, parsed once and reloaded when questions.json changes
+question_bank = QuestionBank(os.path.join(app.root_path, "questions.json"))
+# Fail at startup, not on the first quiz start, if QUIZ_PAPER does not fit the bank
+# or this NumPy no longer draws the papers stored attempts were given
+check_stream()
+compile_sampler(question_bank.get()).check_spec(parse_spec(app.config["QUIZ_PAPER"]))
+
+# Archived bank versions: ones known to be stored, and recently decoded ones
+_archived_bank_versions = set()
+_archived_banks = {}
+_archived_banks_lock = threading.Lock()
+ARCHIVED_BANKS_MAX = 8
+
+def conflict_insert(model):
+    """An INSERT for ``model`` supporting ON CONFLICT clauses, or None on databases without them"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(model)
+
+def archive_bank(bank):
+    """Store a bank version once so attempts drawn from it stay decodable; the caller commits
+
+    Uses the session's own connection: requests call this while holding one,
+    and waiting on a second could exhaust the pool when a hall starts together.
+    The version only counts as archived once that commit succeeds.
+    """
+    if bank.version in _archived_bank_versions:
+        return
+    pending = db.session.info.setdefault("archived_bank_versions", set())
+    if bank.version in pending:
+        return
+    with _archived_banks_lock:
+        if bank.version in _archived_bank_versions:
+            return
+        if db.session.get(QuestionBankArchive, bank.version) is None:
+            values = {"version": bank.version, "data": serialize_bank(bank), "created_at": datetime.utcnow()}
+            stmt = conflict_insert(QuestionBankArchive)
+            if stmt is not None:
+                # Another worker may archive it first; no savepoint, which pysqlite would commit on release
+                db.session.execute(stmt.values(**values).on_conflict_do_nothing(index_elements=["version"]))
+            else:
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(QuestionBankArchive(**values))
+                except IntegrityError:
+                    pass  # Another worker archived it first
+            pending.add(bank.version)
+            return
+        _archived_bank_versions.add(bank.version)
+
+@event.listens_for(db.session, "after_commit")
+def _mark_banks_archived(session):
+    versions = session.info.pop("archived_bank_versions", None)
+    if versions:
+        _archived_bank_versions.update(versions)
+        logger.info(f"Archived question bank {', '.join(sorted(versions))}")
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_unarchived_banks(session):
+    session.info.pop("archived_bank_versions", None)
+
+def bank_for_version(version):
+    """The bank snapshot an attempt was drawn from, or None if that version was never archived"""
+    bank = question_bank.get()
+    if not version or version == bank.version:
+        return bank
+    archived = _archived_banks.get(version)
+    if archived is None:
+        row = db.session.get(QuestionBankArchive, version)
+        if row is None:
+            return None
+        archived = deserialize_bank(version, row.data)
+        with _archived_banks_lock:
+            _archived_banks[version] = archived
+            while len(_archived_banks) > ARCHIVED_BANKS_MAX:
+                _archived_banks.pop(next(iter(_archived_banks)))
+    return archived
+
+with app.app_context():
+    archive_bank(question_bank.get())
+    db.session.commit()
+
+# Writes funnelled through one thread when GROUP_COMMIT is on
+group_commits = GroupCommitter(app, db)
+
+# Live leaderboard, rebuilt from the database at startup and updated on submission
+live_leaderboard = Leaderboard()
+leaderboard_events = Broadcaster()
+LEADERBOARD_SYNC_INTERVAL = 1.0
+LEADERBOARD_STREAM_KEEPALIVE = 15
+
+def leaderboard_query():
+    """Scalar columns of submitted participants, with their submit time"""
+    return (db.session.query(
+                Participant.id, Participant.email, Participant.name, Participant.score,
+                QuizAttempt.category_scores, Participant.profile_pic, Participant.created_at,
+                Participant.updated_at, Participant.leaderboard_seq, QuizAttempt.submitted_at)
+            .outerjoin(QuizAttempt, db.and_(QuizAttempt.participant_id == Participant.id,
+                                            QuizAttempt.submitted_at.isnot(None)))
+            .filter(Participant.quiz_submitted.is_(True)))
+
+def leaderboard_entry(row):
+    """Build a leaderboard entry from a leaderboard_query() row"""
+    pid, email, name, score, category_scores, profile_pic, created_at, updated_at, seq, submitted_at = row
+    return {
+        "id": pid,
+        "email": email,
+        "name": name or "Unknown",
+        "score": score or 0,
+        "category_scores": category_scores or {"Math": 0, "Reasoning": 0, "Verbal": 0},
+        "profile_pic": profile_pic or None,
+        "created_at": created_at.isoformat() if created_at else None,
+        # Participants graded before attempts were recorded fall back to updated_at
+        "submitted_at": submitted_at or updated_at,
+        "seq": seq or 0
+    }
+
+def next_leaderboard_seqs(count):
+    """Reserve ``count`` leaderboard change numbers in the current transaction
+
+    The counter row stays locked until the caller commits, so a change number
+    only becomes visible after every smaller one has been committed.
+    """
+    counter = VersionCounter.__table__
+    bumped = db.session.execute(
+        db.update(counter).where(counter.c.name == "leaderboard").values(value=counter.c.value + count)
+    )
+    if not bumped.rowcount:
+        db.session.execute(db.insert(counter).values(name="leaderboard", value=count))
+    last = db.session.execute(db.select(counter.c.value).where(counter.c.name == "leaderboard")).scalar_one()
+    return list(range(last - count + 1, last + 1))
+
+def sync_leaderboard(force=False):
+    """Fold in score changes committed since the last sync, by this or another worker or 'flask regrade'"""
+    now = time.monotonic()
+    if not force and now < live_leaderboard.synced_at + LEADERBOARD_SYNC_INTERVAL:
+        return
+    live_leaderboard.synced_at = now
+    query = leaderboard_query().filter(Participant.leaderboard_seq > live_leaderboard.watermark)
+    live_leaderboard.sync([leaderboard_entry(row) for row in query])
+    leaderboard_events.publish(live_leaderboard.version)
+
+def leaderboard_row(rank, entry):
+    """Public JSON form of a leaderboard entry"""
+    return {
+        "rank": rank,
+        "id": entry["id"],
+        "email": entry["email"],
+        "name": entry["name"],
+        "score": entry["score"],
+        "category_scores": entry["category_scores"],
+        "profile_pic": entry["profile_pic"],
+        "created_at": entry["created_at"],
+        "submitted_at": entry["submitted_at"].isoformat()
+    }
+
+_leaderboard_sync_thread = None
+_leaderboard_sync_lock = threading.Lock()
+
+def _leaderboard_sync_loop():
+    """While streams are open, poll the database once per process for other workers' changes"""
+    global _leaderboard_sync_thread
+    while True:
+        with _leaderboard_sync_lock:
+            if not leaderboard_events.subscribers:
+                _leaderboard_sync_thread = None
+                return
+        try:
+            with app.app_context():
+                sync_leaderboard()
+        except Exception as e:
+            logger.error(f"Leaderboard sync error: {str(e)}")
+        time.sleep(LEADERBOARD_SYNC_INTERVAL)
+
+def ensure_leaderboard_sync():
+    """Start the background sync thread if it is not already running"""
+    global _leaderboard_sync_thread
+    with _leaderboard_sync_lock:
+        if _leaderboard_sync_thread is None:
+            _leaderboard_sync_thread = threading.Thread(target=_leaderboard_sync_loop, daemon=True)
+            _leaderboard_sync_thread.start()
+
+with app.app_context():
+    live_leaderboard.load([leaderboard_entry(row) for row in leaderboard_query()])
+    live_leaderboard.synced_at = time.monotonic()
+    leaderboard_events.publish(live_leaderboard.version)
 
-# Background scheduler for email tasks
+# Background scheduler; ticks the email job dispatcher
 scheduler = BackgroundScheduler()
 scheduler.start()
 
+EMAIL_DELAY = timedelta(hours=1)
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_DISPATCH_INTERVAL = 30  # seconds
+EMAIL_STALE_AFTER = timedelta(minutes=10)  # Running this long means the dispatcher died
+email_dispatcher_lock = ProcessLock(os.path.join(app.instance_path, "email_dispatcher.lock"))
+email_sender = BatchMailer(mail, RateLimiter(app.config["MAIL_RATE_LIMIT"]))
+
 # Helper Functions
 def is_authenticated():
     """Check if user is authenticated"""
@@ -107,11 +459,366 @@ def require_admin(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
-def get_participant():
-    """Get current participant from database"""
+# Profiles admin-requested and sampled requests; see /admin/profiles
+request_profiler = RequestProfiler(
+    keep=app.config["PROFILE_KEEP"],
+    sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+    endpoints=[e.strip() for e in app.config["PROFILE_ENDPOINTS"].split(",") if e.strip()],
+    kind=app.config["PROFILE_KIND"]
+)
+request_profiler.init_app(app, is_admin)
+
+class ParticipantView(NamedTuple):
+    """The participant fields most routes need, safe to cache"""
+    id: int
+    name: str
+    email: str
+    quiz_submitted: bool
+    score: int
+
+# email -> (expires, ParticipantView); only participants that exist are cached
+_participant_cache = {}
+_participant_cache_lock = threading.Lock()
+PARTICIPANT_CACHE_MAX = 10000
+
+def get_participant(fresh=False):
+    """Get a slim view of the current participant
+
+    The view is cached for the rest of the request and, for
+    PARTICIPANT_CACHE_TTL seconds, in the process. Pass fresh=True where a
+    stale quiz_submitted flag from another worker would matter.
+    """
     if not is_authenticated():
         return None
-    return Participant.query.filter_by(email=session["user_email"]).first()
+    email = session["user_email"]
+
+    if not fresh:
+        cached = g.get("participant")
+        if cached is not None and cached.email == email:
+            return cached
+        hit = _participant_cache.get(email)
+        if hit and hit[0] > time.monotonic():
+            g.participant = hit[1]
+            return hit[1]
+
+    row = (db.session.query(Participant.id, Participant.name, Participant.email,
+                            Participant.quiz_submitted, Participant.score)
+           .filter_by(email=email)
+           .first())
+    if row is None:
+        return None
+
+    view = ParticipantView(*row)
+    g.participant = view
+    ttl = app.config["PARTICIPANT_CACHE_TTL"]
+    if ttl > 0:
+        now = time.monotonic()
+        with _participant_cache_lock:
+            if len(_participant_cache) >= PARTICIPANT_CACHE_MAX:
+                for key in [k for k, (expires, _) in _participant_cache.items() if expires <= now]:
+                    del _participant_cache[key]
+            _participant_cache[email] = (now + ttl, view)
+    return view
+
+def invalidate_participant(email):
+    """Drop cached views after the participant row changes"""
+    if g.get("participant") is not None and g.participant.email == email:
+        g.pop("participant")
+    with _participant_cache_lock:
+        _participant_cache.pop(email, None)
+
+def new_attempt(participant, bank):
+    """Sample a paper from the question bank and persist it as an open attempt
+
+    Questions from the participant's earlier attempts are avoided while the
+    bank has others left.
+    """
+    seen = set()
+    for earlier in QuizAttempt.query.filter_by(participant_id=participant.id):
+        seen.update(attempt_paper(earlier)[1])
+
+    archive_bank(bank)
+    spec = app.config["QUIZ_PAPER"]
+    seed = random.getrandbits(63)
+    sampler = compile_sampler(bank)
+    sampler.check_spec(parse_spec(spec))  # The bank may have been reloaded since startup
+    question_ids, option_orders = sampler.draw(seed, parse_spec(spec), exclude=seen)
+    attempt = QuizAttempt(
+        participant_id=participant.id,
+        bank_version=bank.version,
+        seed=seed,
+        paper_spec=spec,
+        sampler_version=SAMPLER_VERSION,
+        # A paper that avoided earlier questions depends on history, so store it outright
+        question_ids=question_ids if seen else [],
+        option_orders=option_orders if seen else []
+    )
+    db.session.add(attempt)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # uq_quiz_attempt_open: a concurrent request, e.g. a double-clicked Start, opened one first
+        db.session.rollback()
+        attempt = get_open_attempt(participant)
+        if attempt is None:
+            raise
+    return attempt
+
+def get_submitted_attempt(participant):
+    """Get the attempt the participant submitted, if any"""
+    return (QuizAttempt.query
+            .filter(QuizAttempt.participant_id == participant.id, QuizAttempt.submitted_at.isnot(None))
+            .order_by(QuizAttempt.id.desc())
+            .first())
+
+def get_accepted_attempt(participant):
+    """Get the participant's submitted attempt still waiting to be graded, if any"""
+    return (QuizAttempt.query
+            .filter(QuizAttempt.participant_id == participant.id, QuizAttempt.submitted_at.isnot(None),
+                    QuizAttempt.graded_at.is_(None))
+            .first())
+
+def get_open_attempt(participant):
+    """Get the participant's unsubmitted attempt, if any"""
+    return (QuizAttempt.query
+            .filter_by(participant_id=participant.id, submitted_at=None)
+            .order_by(QuizAttempt.id.desc())
+            .first())
+
+# Columns attempt_paper() and attempt_answers() read, for queries selecting rows instead of attempts
+ATTEMPT_COLUMNS = (QuizAttempt.bank_version, QuizAttempt.seed, QuizAttempt.paper_spec, QuizAttempt.sampler_version,
+                   QuizAttempt.question_ids, QuizAttempt.option_orders, QuizAttempt.answer_bits, QuizAttempt.answers)
+
+def attempt_paper(attempt):
+    """(bank, question_ids, option_orders) of an attempt, regenerated from its seed if not stored"""
+    bank = bank_for_version(attempt.bank_version)
+    if attempt.question_ids or attempt.seed is None:
+        # Stored papers, including ones drawn before banks were archived, only need the current bank's questions
+        return bank or question_bank.get(), attempt.question_ids or [], attempt.option_orders or []
+    if bank is None:
+        # Regenerating from the current bank would silently give a different paper
+        logger.error(f"Question bank {attempt.bank_version} is not archived; seeded papers drawn from it are lost")
+        raise ValueError(f"Cannot regenerate a paper from question bank {attempt.bank_version}: it was never archived")
+    question_ids, option_orders = compile_sampler(bank).draw(attempt.seed, parse_spec(attempt.paper_spec),
+                                                             version=attempt.sampler_version)
+    return bank, question_ids, option_orders
+
+def attempt_answers(attempt, paper=None):
+    """Decode an attempt's answers into {question_id: [chosen options]}"""
+    if attempt.answer_bits is None:
+        return attempt.answers or {}
+    bank, question_ids, _ = paper or attempt_paper(attempt)
+    return decode_answers(bank, question_ids, attempt.answer_bits)
+
+def attempt_questions(attempt, paper=None):
+    """Rebuild the questions of an attempt as shown to the participant"""
+    bank, question_ids, option_orders = paper or attempt_paper(attempt)
+    questions = []
+    for qid, option_order in zip(question_ids, option_orders or [[]] * len(question_ids)):
+        q = bank.by_id.get(qid)
+        if q is None:
+            continue
+        question = q._asdict()
+        # Attempts migrated from before option orders were recorded use bank order
+        question["options"] = [q.options[i] for i in option_order] if option_order else list(q.options)
+        question["fragment_key"] = (bank.version, qid, tuple(option_order))
+        questions.append(question)
+    return questions
+
+# Rendered question blocks of quiz.html, shared by every attempt showing the same question and option order
+quiz_fragments = FragmentCache(app.config["QUIZ_FRAGMENT_CACHE"])
+
+def question_fragments(questions):
+    """Rendered HTML for each question of a paper, from the fragment cache"""
+    template = app.jinja_env.get_template("partials/quiz_question.html")
+    return [
+        quiz_fragments.get_or_render(q["fragment_key"], lambda q=q: Markup(template.render(q=q)))
+        for q in questions
+    ]
+
+def bump_counters(counts):
+    """Add to analytics counters in the current transaction"""
+    values = [{"name": name, "value": value} for name, value in sorted(counts.items()) if value]
+    if not values:
+        return
+    stmt = conflict_insert(AnalyticsCounter)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(index_elements=["name"],
+                                          set_={"value": AnalyticsCounter.value + stmt.excluded.value})
+        db.session.execute(stmt, values)
+        return
+    for item in values:
+        updated = db.session.execute(
+            db.update(AnalyticsCounter).where(AnalyticsCounter.name == item["name"])
+            .values(value=AnalyticsCounter.value + item["value"])
+        )
+        if not updated.rowcount:
+            db.session.execute(db.insert(AnalyticsCounter).values(**item))
+
+def record_answer_save(attempt_id, seq, answers):
+    """Append an autosaved batch; returns False if the batch was already saved. The caller commits"""
+    values = {"attempt_id": attempt_id, "seq": seq, "answers": answers, "saved_at": datetime.utcnow()}
+    stmt = conflict_insert(AnswerSave)
+    if stmt is not None:
+        result = db.session.execute(stmt.values(**values).on_conflict_do_nothing(index_elements=["attempt_id", "seq"]))
+        return result.rowcount == 1
+    if db.session.query(AnswerSave.id).filter_by(attempt_id=attempt_id, seq=seq).first():
+        return False
+    db.session.add(AnswerSave(**values))
+    return True
+
+def autosaved_answers(attempt_id):
+    """Replay an attempt's autosaved batches into ({question_id: [chosen options]}, last batch number)"""
+    answers = {}
+    last_seq = 0
+    rows = (db.session.query(AnswerSave.seq, AnswerSave.answers)
+            .filter(AnswerSave.attempt_id == attempt_id)
+            .order_by(AnswerSave.seq))
+    for seq, changes in rows:
+        answers.update(changes)
+        last_seq = seq
+    return answers, last_seq
+
+def clean_answers(bank, question_ids, changes):
+    """Check {question_id: [chosen options]} against a paper, dropping options the question does not have
+
+    Raises ValueError naming the first question that is not on the paper or whose choices are not a list.
+    """
+    asked = set(question_ids)
+    answers = {}
+    for key, choices in changes.items():
+        question = bank.by_id.get(int(key)) if str(key).isdigit() and int(key) in asked else None
+        if question is None or not isinstance(choices, list):
+            raise ValueError(key)
+        choices = [c for c in choices if c in question.options]
+        answers[str(question.id)] = choices if question.multiple else choices[:1]
+    return answers
+
+def accept_submission(attempt_id, answer_bits, submitted_at):
+    """Store a submission's answers for grading; returns False if it was already submitted. The caller commits"""
+    result = db.session.execute(
+        db.update(QuizAttempt)
+        .where(QuizAttempt.id == attempt_id, QuizAttempt.submitted_at.is_(None))
+        .values(answer_bits=answer_bits, submitted_at=submitted_at)
+    )
+    return result.rowcount == 1
+
+def grade_attempts(attempt_ids):
+    """Grade accepted submissions together and publish their scores; returns how many were graded
+
+    An attempt is claimed by setting graded_at only while it is unset, so one
+    queued twice, or also picked up by the sweep in another process, is
+    graded once.
+    """
+    rows = (db.session.query(QuizAttempt.id, QuizAttempt.participant_id, QuizAttempt.submitted_at, *ATTEMPT_COLUMNS,
+                             Participant.email, Participant.branch, Participant.year)
+            .join(Participant, Participant.id == QuizAttempt.participant_id)
+            .filter(QuizAttempt.id.in_(attempt_ids), QuizAttempt.submitted_at.isnot(None),
+                    QuizAttempt.graded_at.is_(None))
+            .all())
+    if not rows:
+        return 0
+
+    answer_key = compile_key(question_bank.get())
+    papers = [attempt_paper(row) for row in rows]
+    answers = [attempt_answers(row, paper) for row, paper in zip(rows, papers)]
+    totals, by_category = answer_key.score_batch(np.stack([answer_key.encode_row(a) for a in answers]))
+
+    graded_at = datetime.utcnow()
+    graded = []
+    for row, paper, row_answers, total, cat_scores in zip(rows, papers, answers, totals.tolist(),
+                                                          by_category.tolist()):
+        category_scores = dict(zip(answer_key.categories, cat_scores))
+        claimed = db.session.execute(
+            db.update(QuizAttempt)
+            .where(QuizAttempt.id == row.id, QuizAttempt.graded_at.is_(None))
+            .values(category_scores=category_scores, graded_at=graded_at)
+        ).rowcount
+        if claimed:
+            graded.append((row, paper[1], row_answers, total, category_scores))
+    if graded:
+        seqs = next_leaderboard_seqs(len(graded))
+        db.session.bulk_update_mappings(Participant, [
+            {"id": row.participant_id, "score": total, "quiz_submitted": True, "updated_at": graded_at,
+             "leaderboard_seq": seq}
+            for (row, _, _, total, _), seq in zip(graded, seqs)
+        ])
+        bump_counters(count_submissions(answer_key, [
+            (question_ids, row_answers, row.branch, row.year) for row, question_ids, row_answers, _, _ in graded
+        ]))
+    db.session.commit()
+
+    for row, *_ in graded:
+        invalidate_participant(row.email)
+    if graded:
+        # Read the scores back rather than applying our own rows: another grading thread can
+        # commit before us and apply after us, which would hide its rows from delta clients
+        sync_leaderboard(force=True)
+    return len(graded)
+
+GRADING_MAX_FAILURES = 5
+
+def record_grading_failure(attempt_id, error):
+    """Count a failed grading of one attempt, so the sweep stops re-queueing one that keeps failing"""
+    db.session.rollback()
+    db.session.execute(
+        db.update(QuizAttempt).where(QuizAttempt.id == attempt_id)
+        .values(grading_failures=QuizAttempt.grading_failures + 1, grading_error=str(error)[:500])
+    )
+    failures = db.session.query(QuizAttempt.grading_failures).filter(QuizAttempt.id == attempt_id).scalar()
+    db.session.commit()
+    if failures is not None and failures >= GRADING_MAX_FAILURES:
+        logger.error(f"Giving up on grading attempt {attempt_id} after {failures} failures: {str(error)}; "
+                     f"reset its grading_failures to retry")
+
+def grade_inline(attempt_id):
+    """Grade one attempt on this thread, recording a failure instead of raising"""
+    try:
+        grade_attempts([attempt_id])
+    except Exception as e:
+        logger.error(f"Grading attempt {attempt_id} failed: {str(e)}")
+        record_grading_failure(attempt_id, e)
+
+# Accepted submissions are graded in batches off the request threads
+grading_pool = BatchWorkerPool(app, grade_attempts, workers=app.config["GRADING_WORKERS"], name="grading",
+                               on_failure=record_grading_failure)
+
+GRADING_SWEEP_INTERVAL = 15  # seconds
+GRADING_SWEEP_AFTER = timedelta(seconds=30)  # Still ungraded this long after submission: its worker was lost
+grading_sweeper_lock = ProcessLock(os.path.join(app.instance_path, "grading_sweeper.lock"))
+
+def sweep_ungraded_attempts(limit=5000):
+    """Queue accepted submissions no worker finished grading, e.g. after a restart"""
+    if not grading_sweeper_lock.acquire():
+        return
+    try:
+        with app.app_context():
+            cutoff = datetime.utcnow() - GRADING_SWEEP_AFTER
+            stale = [attempt_id for (attempt_id,) in
+                     db.session.query(QuizAttempt.id)
+                     .filter(QuizAttempt.graded_at.is_(None), QuizAttempt.submitted_at <= cutoff,
+                             QuizAttempt.grading_failures < GRADING_MAX_FAILURES)
+                     .limit(limit)]
+        if stale:
+            logger.warning(f"Re-queueing {len(stale)} ungraded submissions")
+        for attempt_id in stale:
+            if app.config["GRADING_WORKERS"]:
+                grading_pool.submit(attempt_id)
+            else:
+                with app.app_context():
+                    grade_inline(attempt_id)
+    except Exception as e:
+        logger.error(f"Grading sweep error: {str(e)}")
+
+scheduler.add_job(
+    sweep_ungraded_attempts,
+    'interval',
+    seconds=GRADING_SWEEP_INTERVAL,
+    id="sweep_ungraded_attempts",
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
 
 # Routes
 @app.route("/")
@@ -142,7 +849,7 @@ def google_login():
         session["google_id"] = user_info["id"]
 
         # Check if participant already exists
-        participant = Participant.query.filter_by(email=user_info["email"]).first()
+        participant = get_participant()
         
         if participant:
             if participant.quiz_submitted:
@@ -182,7 +889,7 @@ def profile_form():
         if request.method == "GET":
             session.pop('_flashes', None)
             
-        existing_participant = Participant.query.filter_by(email=session["user_email"]).first()
+        existing_participant = get_participant()
         if existing_participant:
             flash("Profile already exists. Redirecting to instructions.", "info")
             return redirect(url_for('instructions'))
@@ -224,6 +931,7 @@ def profile_form():
 
             db.session.add(participant)
             db.session.commit()
+            invalidate_participant(session["user_email"])
 
             flash("Profile completed successfully! You can now take the quiz.", "success")
             return redirect(url_for('instructions'))
@@ -268,73 +976,80 @@ def quiz():
         if request.method == "GET":
             session.pop('_flashes', None)
             
-        participant = get_participant()
-        if not participant:
+        view = get_participant()
+        if not view:
             flash("Please complete your profile first.", "warning")
             return redirect(url_for("profile_form"))
 
+        # Quiz decisions use the row itself, never a cached view
+        participant = db.session.get(Participant, view.id)
         if participant.quiz_submitted:
             flash("You have already submitted the quiz.", "info")
             return redirect(url_for("thank_you"))
 
-        # Quiz questions
-        questions_by_category = {
-            "Math": [
-                {"id": 1, "question": "What is 15% of 200?", "options": ["20", "25", "30", "35"], "answer": "30"},
-                {"id": 2, "question": "If x + 3 = 7, what is x?", "options": ["3", "4", "5", "6"], "answer": "4"},
-                {"id": 3, "question": "Find the next number: 2, 4, 8, 16, ?", "options": ["18", "24", "32", "20"], "answer": "32"},
-            ],
-            "Reasoning": [
-                {"id": 4, "question": "Find the odd one out: 2, 5, 7, 9", "options": ["2", "5", "7", "9"], "answer": "2"},
-                {"id": 5, "question": "If all Bloops are Razzies and all Razzies are Lazzies, are all Bloops Lazzies?", "options": ["Yes", "No"], "answer": "Yes"},
-            ],
-            "Verbal": [
-                {"id": 6, "question": "Choose the correct synonym of 'Abundant'", "options": ["Scarce", "Plentiful", "Rare", "Little"], "answer": "Plentiful"},
-                {"id": 7, "question": "Choose the correct antonym of 'Scarce'", "options": ["Plentiful", "Little", "Rare", "Tiny"], "answer": "Plentiful"},
-            ]
-        }
-
-        # Select questions for quiz
-        quiz_questions = []
-        for category, qlist in questions_by_category.items():
-            selected = random.sample(qlist, min(2, len(qlist)))
-            for q in selected:
-                q["category"] = category
-                random.shuffle(q["options"])
-            quiz_questions.extend(selected)
-
-        random.shuffle(quiz_questions)
+        bank = question_bank.get()
+        attempt = get_open_attempt(participant)
+        if not attempt and get_accepted_attempt(participant):
+            # Submitted and waiting to be graded
+            return redirect(url_for("thank_you"))
 
         if request.method == "POST":
-            # Process quiz submission
-            user_answers = {}
-            total_score = 0
-            category_scores = {"Math": 0, "Reasoning": 0, "Verbal": 0}
-
-            for q in quiz_questions:
-                ans = request.form.getlist(f"q{q['id']}")
-                user_answers[str(q['id'])] = ans
-                category = q['category']
-
-                # Check answer
-                if q.get("multiple"):
-                    if set(ans) == set(q["answer"]):
-                        total_score += 1
-                        category_scores[category] += 1
+            # Seal the attempt the page was rendered for, which need not be the latest open one;
+            # pages served before the attempt field was added fall back to that
+            form_attempt = request.form.get("attempt", type=int)
+            if form_attempt is not None:
+                attempt = db.session.get(QuizAttempt, form_attempt)
+                if attempt is not None and attempt.participant_id != participant.id:
+                    attempt = None
+                elif attempt is not None and attempt.submitted_at is not None:
+                    return redirect(url_for("thank_you"))
+            if not attempt:
+                flash("Your quiz session was not found. Please start the quiz again.", "warning")
+                return redirect(url_for("instructions"))
+
+            # Seal the attempt. With autosave running, the page sends only the changes the server has
+            # not acknowledged (pending, in flight or rejected), cleared ones included, and the rest
+            # comes from the autosave log. Without it the form carries every answer as it stands, so
+            # it wins outright; a POST with neither (no answers_included marker, e.g. from a page
+            # served before the marker) is merged with the log question by question
+            paper_bank, question_ids, _ = attempt_paper(attempt)
+            unsaved_answers = request.form.get("unsaved_answers")
+            if unsaved_answers is not None:
+                try:
+                    changes = json.loads(unsaved_answers)
+                    if not isinstance(changes, dict):
+                        raise ValueError("not an object")
+                    changes = clean_answers(paper_bank, question_ids, changes)
+                except ValueError as e:
+                    logger.warning(f"Unreadable unsaved answers for attempt {attempt.id}: {e}")
+                    flash("Your answers could not be read. Please return to the quiz and submit again.", "warning")
+                    return redirect(url_for("instructions"))
+                user_answers, _ = autosaved_answers(attempt.id)
+                user_answers.update(changes)
+            elif request.form.get("answers_included"):
+                user_answers = {str(qid): request.form.getlist(f"q{qid}") for qid in question_ids}
+            else:
+                saved_answers, _ = autosaved_answers(attempt.id)
+                user_answers = {
+                    str(qid): request.form.getlist(f"q{qid}") or saved_answers.get(str(qid), [])
+                    for qid in question_ids
+                }
+            answer_bits = encode_answers(paper_bank, question_ids, user_answers)
+            attempt_id = attempt.id
+
+            # Accept now and grade later, so the request only waits for one small write
+            db.session.rollback()
+            if app.config["GROUP_COMMIT"]:
+                accepted = group_commits.submit(accept_submission, attempt_id, answer_bits,
+                                                datetime.utcnow()).result(timeout=60)
+            else:
+                accepted = accept_submission(attempt_id, answer_bits, datetime.utcnow())
+                db.session.commit()
+            if accepted:
+                if app.config["GRADING_WORKERS"]:
+                    grading_pool.submit(attempt_id)
                 else:
-                    if ans and ans[0] == q["answer"]:
-                        total_score += 1
-                        category_scores[category] += 1
-
-            # Save results
-            participant.answers = user_answers
-            participant.questions = quiz_questions  # Store the questions that were asked
-            participant.score = total_score
-            participant.category_scores = category_scores
-            participant.quiz_submitted = True
-            participant.updated_at = datetime.utcnow()
-            
-            db.session.commit()
+                    grade_inline(attempt_id)
 
             # Check if this was an auto-submit due to time up
             time_up = request.form.get('time_up', 'false').lower() == 'true'
@@ -342,17 +1057,60 @@ def quiz():
             if time_up:
                 flash("Time is over, so your responses have been submitted.", "warning")
             else:
-                flash(f"Quiz completed! Your score: {total_score}/{len(quiz_questions)}", "success")
+                flash("Quiz submitted! Your answers have been saved.", "success")
             
             return redirect(url_for("thank_you"))
 
-        return render_template("quiz.html", questions=quiz_questions, timer=300)
+        if not attempt:
+            attempt = new_attempt(participant, bank)
+
+        questions = attempt_questions(attempt)
+        saved_answers, last_seq = autosaved_answers(attempt.id)
+        return render_template("quiz.html", questions=questions, fragments=question_fragments(questions), timer=300,
+                               attempt_id=attempt.id, saved_answers=saved_answers, last_seq=last_seq)
 
     except Exception as e:
         logger.error(f"Quiz error: {str(e)}")
         flash("An error occurred during the quiz. Please try again.", "danger")
         return redirect(url_for("instructions"))
 
+@app.route("/quiz/answers", methods=["POST"])
+@require_auth
+def save_answers():
+    """Autosave a batch of answer changes from the quiz page"""
+    try:
+        data = request.get_json(silent=True) or {}
+        attempt_id, seq, changes = data.get("attempt"), data.get("seq"), data.get("answers")
+        if (not isinstance(attempt_id, int) or not isinstance(seq, int) or isinstance(seq, bool)
+                or not 0 < seq < 2 ** 31 or not isinstance(changes, dict)):
+            return jsonify({"success": False, "error": "Expected attempt, seq and answers"}), 400
+
+        view = get_participant()
+        attempt = db.session.get(QuizAttempt, attempt_id)
+        if not view or not attempt or attempt.participant_id != view.id:
+            return jsonify({"success": False, "error": "Quiz attempt not found"}), 404
+        if attempt.submitted_at is not None:
+            return jsonify({"success": False, "error": "Quiz already submitted"}), 409
+
+        bank, question_ids, _ = attempt_paper(attempt)
+        try:
+            answers = clean_answers(bank, question_ids, changes)
+        except ValueError as e:
+            return jsonify({"success": False, "error": f"Invalid answer for question {e}"}), 400
+
+        db.session.rollback()
+        if app.config["GROUP_COMMIT"]:
+            saved = group_commits.submit(record_answer_save, attempt_id, seq, answers).result(timeout=60)
+        else:
+            saved = record_answer_save(attempt_id, seq, answers)
+            db.session.commit()
+        return jsonify({"success": True, "seq": seq, "duplicate": not saved})
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Answer autosave error: {str(e)}")
+        return jsonify({"success": False, "error": "Could not save answers"}), 500
+
 @app.route("/thank_you")
 @require_auth
 def thank_you():
@@ -367,6 +1125,14 @@ def thank_you():
             return redirect(url_for("profile_form"))
 
         if not participant.quiz_submitted:
+            # The cached view may predate a submission made through another worker
+            participant = get_participant(fresh=True)
+        if not participant.quiz_submitted:
+            attempt = get_accepted_attempt(participant)
+            if attempt:
+                # Past GRADING_MAX_FAILURES the sweep no longer retries, so reloading would never end
+                failed = attempt.grading_failures >= GRADING_MAX_FAILURES
+                return render_template("grading.html", name=participant.name, failed=failed)
             flash("Please complete the quiz first.", "warning")
             return redirect(url_for("quiz"))
 
@@ -393,28 +1159,177 @@ def leaderboard():
 @require_auth
 @require_admin
 def leaderboard_data():
-    """API endpoint for leaderboard data (admin only)"""
+    """API endpoint for leaderboard data (admin only)
+
+    Responses carry an ETag of the leaderboard version, so an unchanged poll is
+    answered with 304. ``since=<version>`` returns only rows changed after that
+    version, otherwise rows are paged with ``cursor`` and ``limit``.
+    """
     try:
-        participants = Participant.query.filter_by(quiz_submitted=True).order_by(Participant.score.desc()).all()
-
-        data = []
-        for p in participants:
-            data.append({
-                "id": p.id,
-                "email": p.email,
-                "name": p.name or "Unknown",
-                "score": p.score or 0,
-                "category_scores": p.category_scores or {"Math": 0, "Reasoning": 0, "Verbal": 0},
-                "profile_pic": p.profile_pic or None,
-                "created_at": p.created_at.isoformat() if p.created_at else None
-            })
-
-        return jsonify({"success": True, "data": data})
+        sync_leaderboard()
+        version = live_leaderboard.version
+        etag = f"lb-{version}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        since = request.args.get("since", type=int)
+        next_cursor = None
+        if since is not None:
+            rows = live_leaderboard.changed_since(since)
+        else:
+            limit = max(1, min(request.args.get("limit", 100, type=int), 500))
+            try:
+                rows, next_cursor = live_leaderboard.page(request.args.get("cursor"), limit)
+            except ValueError:
+                return jsonify({"success": False, "error": "Invalid cursor"}), 400
+
+        data = [leaderboard_row(rank, p) for rank, p in rows]
+
+        response = jsonify({
+            "success": True,
+            "version": version,
+            "delta": since is not None,
+            "next_cursor": next_cursor,
+            "stats": live_leaderboard.stats(),
+            "data": data
+        })
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
 
     except Exception as e:
         logger.error(f"Leaderboard data error: {str(e)}")
         return jsonify({"success": False, "error": "Failed to load leaderboard data"}), 500
 
+@app.route("/analytics_data")
+@require_auth
+@require_admin
+def analytics_data():
+    """Per-question, score and branch/year statistics from the analytics counters (admin only)"""
+    try:
+        counts = dict(db.session.query(AnalyticsCounter.name, AnalyticsCounter.value))
+        response = jsonify({"success": True, **summarize_analytics(counts, question_bank.get())})
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    except Exception as e:
+        logger.error(f"Analytics data error: {str(e)}")
+        return jsonify({"success": False, "error": "Failed to load analytics data"}), 500
+
+@app.route("/leaderboard/stream")
+@require_auth
+@require_admin
+def leaderboard_stream():
+    """Server-Sent Events stream of leaderboard changes (admin only)
+
+    Each event carries the rows changed since the previous one, in the same
+    form as leaderboard_data's delta mode. Clients resume from Last-Event-ID
+    when reconnecting, or from ``since`` on first connect.
+    """
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", type=int)
+    if since is None:
+        since = live_leaderboard.version
+
+    def generate(version):
+        with leaderboard_events.subscribe():
+            ensure_leaderboard_sync()
+            yield "retry: 3000\n\n"
+            while True:
+                current = leaderboard_events.wait(version, LEADERBOARD_STREAM_KEEPALIVE)
+                if current == version:
+                    yield ": keepalive\n\n"
+                    continue
+                rows = live_leaderboard.changed_since(version)
+                version = current
+                payload = json.dumps({
+                    "version": version,
+                    "stats": live_leaderboard.stats(),
+                    "data": [leaderboard_row(rank, p) for rank, p in rows]
+                })
+                yield f"id: {version}\nevent: leaderboard\ndata: {payload}\n\n"
+
+    return Response(generate(since), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# Rows fetched and written per batch by /export
+EXPORT_CHUNK = 1000
+
+def export_columns(categories, question_ids):
+    """(name, kind) for each exported column"""
+    columns = [("id", "int"), ("name", "str"), ("email", "str"), ("urn", "str"), ("crn", "str"),
+               ("branch", "str"), ("year", "int"), ("score", "int"), ("submitted_at", "datetime")]
+    columns += [(category, "int") for category in categories]
+    columns += [(f"q{qid}", "str") for qid in question_ids]
+    return columns
+
+def export_batches(include_answers, categories, question_ids):
+    """Stream participants with their submitted attempt, EXPORT_CHUNK rows at a time"""
+    stmt = (db.select(Participant.id, Participant.name, Participant.email, Participant.urn, Participant.crn,
+                      Participant.branch, Participant.year, Participant.score, QuizAttempt.submitted_at,
+                      QuizAttempt.category_scores, *(ATTEMPT_COLUMNS if include_answers else ()))
+            .outerjoin(QuizAttempt, db.and_(QuizAttempt.participant_id == Participant.id,
+                                            QuizAttempt.graded_at.isnot(None)))
+            .order_by(Participant.id, QuizAttempt.id.desc())
+            .execution_options(yield_per=EXPORT_CHUNK))
+    last_id = None
+    try:
+        for chunk in db.session.execute(stmt).partitions():
+            batch = []
+            for row in chunk:
+                if row[0] == last_id:
+                    continue  # Older submitted attempt of the same participant
+                last_id = row[0]
+                category_scores = row[9] or {}
+                values = list(row[:9]) + [category_scores.get(c) for c in categories]
+                if include_answers:
+                    answers = attempt_answers(row)
+                    values += ["; ".join(answers.get(str(qid), [])) or None for qid in question_ids]
+                batch.append(values)
+            yield batch
+    except Exception as e:
+        logger.error(f"Export error: {str(e)}")
+        raise
+
+@app.route("/export")
+@require_auth
+@require_admin
+def export_results():
+    """Stream participant results as CSV, Parquet or Arrow (admin only)
+
+    ``format`` is csv (default), parquet or arrow; ``answers=1`` adds a column
+    per question with the chosen options.
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": f"Unknown format {fmt!r}"}), 400
+    include_answers = request.args.get("answers") == "1"
+
+    bank = question_bank.get()
+    question_ids = [q.id for q in bank.questions] if include_answers else []
+    columns = export_columns(bank.categories, question_ids)
+    batches = export_batches(include_answers, bank.categories, question_ids)
+    if fmt == "csv":
+        chunks = csv_chunks(columns, batches)
+    else:
+        try:
+            arrow_schema(columns)
+        except ExportUnavailable as e:
+            return jsonify({"success": False, "error": str(e)}), 501
+        chunks = arrow_chunks(columns, batches, fmt)
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"quiz-results-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Cache-Control": "no-store"
+    })
+
 @app.route("/dev")
 def dev():
     """Developer page showcasing the developer"""
@@ -428,25 +1343,21 @@ def send_quiz_email():
     """Send quiz results via email"""
     try:
         participant = get_participant()
+        if participant and not participant.quiz_submitted:
+            participant = get_participant(fresh=True)
         if not participant or not participant.quiz_submitted:
             flash("Please complete the quiz first.", "warning")
             return redirect(url_for("quiz"))
 
-        # Get the questions that were actually asked from the database
-        quiz_questions = participant.questions or []
-        
-        if not quiz_questions:
+        if not get_submitted_attempt(participant):
             flash("No quiz questions found. Please contact support.", "warning")
             return redirect(url_for("thank_you"))
 
-        # Schedule email to be sent later
-        scheduler.add_job(
-            send_email_later,
-            'date',
-            run_date=datetime.now() + timedelta(hours=1),
-            args=[participant.email, quiz_questions, participant.answers, participant.score],
-            id=f"email_{participant.id}_{datetime.now().timestamp()}"
-        )
+        # Queue the email; a pending job for this participant already covers it
+        pending = EmailJob.query.filter_by(participant_id=participant.id, status="pending").first()
+        if not pending:
+            db.session.add(EmailJob(participant_id=participant.id, run_at=datetime.utcnow() + EMAIL_DELAY))
+            db.session.commit()
 
         flash("Your detailed quiz results will be emailed to you within 1 hour!", "success")
         return redirect(url_for("thank_you"))
@@ -456,86 +1367,395 @@ def send_quiz_email():
         flash("Failed to schedule email. Please try again.", "danger")
         return redirect(url_for("thank_you"))
 
-def send_email_later(participant_email, questions, answers, score):
-    """Send quiz results email with detailed question analysis"""
+class ResultRow(NamedTuple):
+    """One question of the results email; attribute access keeps rendering cheap"""
+    id: int
+    category: str
+    question: str
+    your_answer: str
+    correct_answer: str
+    correct: bool
+
+def build_results_email(participant_email, questions, answers, score):
+    """Build the quiz results email with detailed question analysis"""
+    bank = question_bank.get()
+    answer_key = compile_key(bank)
+
+    results = []
+    for q in questions:
+        user_ans = answers.get(str(q['id']), [])
+        # Prefer the current bank so a corrected answer key is reflected
+        bank_question = bank.by_id.get(q['id'])
+        correct_ans = bank_question.answer if bank_question else q['answer']
+        if isinstance(correct_ans, (list, tuple)):
+            correct_ans = ', '.join(correct_ans)
+        results.append(ResultRow(
+            q['id'], q['category'], q['question'], ', '.join(user_ans), correct_ans,
+            answer_key.is_correct(q['id'], user_ans)
+        ))
+
+    context = {
+        'score': score,
+        'total': len(questions),
+        'percentage': (score / len(questions)) * 100 if questions else 0,
+        'results': results
+    }
+    # jinja_env keeps compiled templates cached; .html is autoescaped, .txt is not
+    return Message(
+        "Your Aptitude Quiz Results - ITian Club",
+        sender=app.config['MAIL_DEFAULT_SENDER'],
+        recipients=[participant_email],
+        body=app.jinja_env.get_template("email/results.txt").render(context),
+        html=app.jinja_env.get_template("email/results.html").render(context)
+    )
+
+def results_email_for(participant_id):
+    """Build the results email for one participant; raises if they have no submitted attempt"""
+    participant = db.session.get(Participant, participant_id)
+    attempt = get_submitted_attempt(participant) if participant else None
+    if not attempt:
+        raise ValueError(f"Participant {participant_id} has no submitted attempt")
+
+    paper = attempt_paper(attempt)
+    return build_results_email(participant.email, attempt_questions(attempt, paper),
+                               attempt_answers(attempt, paper), participant.score)
+
+def finish_email_job(job, error):
+    """Record the outcome of one send, scheduling a retry with backoff on failure"""
+    if error is None:
+        job.status = "sent"
+        return
+    logger.error(f"Email sending error for job {job.id}: {str(error)}")
+    job.attempts += 1
+    job.last_error = str(error)[:500]
+    if job.attempts >= EMAIL_MAX_ATTEMPTS:
+        job.status = "failed"
+    else:
+        job.status = "pending"
+        job.run_at = datetime.utcnow() + retry_delay(job.attempts)
+
+def dispatch_email_jobs(batch_size=100):
+    """Send due email jobs over one SMTP connection per batch
+
+    Only the process holding the dispatcher lock does any work.
+    """
+    if not email_dispatcher_lock.acquire():
+        return
+
+    with app.app_context():
+        now = datetime.utcnow()
+        EmailJob.query.filter(
+            EmailJob.status == "running", EmailJob.updated_at < now - EMAIL_STALE_AFTER
+        ).update({"status": "pending"})
+        db.session.commit()
+
+        while True:
+            due = [job_id for (job_id,) in (db.session.query(EmailJob.id)
+                   .filter(EmailJob.status == "pending", EmailJob.run_at <= datetime.utcnow())
+                   .order_by(EmailJob.run_at)
+                   .limit(batch_size))]
+            if not due:
+                return
+
+            # Claim the batch so a restarted dispatcher does not send it again
+            EmailJob.query.filter(EmailJob.id.in_(due), EmailJob.status == "pending").update(
+                {"status": "running", "updated_at": datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            jobs = EmailJob.query.filter(EmailJob.id.in_(due), EmailJob.status == "running").all()
+
+            errors = {}
+
+            def messages():
+                for job in jobs:
+                    try:
+                        yield job, results_email_for(job.participant_id)
+                    except Exception as e:
+                        errors[job] = e
+
+            for job, error in email_sender.send_all(messages()):
+                errors[job] = error
+            for job in jobs:
+                finish_email_job(job, errors.get(job))
+            db.session.commit()
+            logger.info(f"Dispatched {len(jobs)} email jobs")
+
+scheduler.add_job(
+    dispatch_email_jobs,
+    'interval',
+    seconds=EMAIL_DISPATCH_INTERVAL,
+    id="dispatch_email_jobs",
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
+
+# Bulk "email all results", streamed in chunks through a pool of SMTP workers
+BULK_EMAIL_CHUNK = 500
+
+def bulk_email_progress(run):
+    return {
+        "id": run.id,
+        "status": run.status,
+        "total": run.total,
+        "processed": run.processed,
+        "sent": run.sent,
+        "failed": run.failed,
+        "last_error": run.last_error,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "updated_at": run.updated_at.isoformat() if run.updated_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None
+    }
+
+def update_bulk_email_run(run_id, **values):
+    """Write run progress on its own connection, leaving the streaming read open"""
+    values["updated_at"] = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(db.update(BulkEmailRun).where(BulkEmailRun.id == run_id).values(**values))
+
+def run_bulk_email(run_id):
+    """Email every submitted participant after the run's cursor
+
+    Progress is saved after each chunk has been sent, so a crashed run resumes
+    from the last finished chunk (and may resend at most that chunk).  Failed
+    sends are queued as email jobs for the regular dispatcher to retry.
+    """
+    with app.app_context():
+        run = db.session.get(BulkEmailRun, run_id)
+        stats = {"cursor": run.cursor, "processed": run.processed, "sent": run.sent, "failed": run.failed}
+        db.session.rollback()
+
+        pool = MailerPool(app, mail, app.config["BULK_EMAIL_WORKERS"], email_sender.rate_limiter)
+        stmt = (db.select(Participant.id, Participant.email, Participant.score, *ATTEMPT_COLUMNS)
+                .join(QuizAttempt, QuizAttempt.participant_id == Participant.id)
+                .where(Participant.quiz_submitted.is_(True), QuizAttempt.submitted_at.isnot(None),
+                       Participant.id > stats["cursor"])
+                .order_by(Participant.id, QuizAttempt.id.desc())
+                .execution_options(yield_per=BULK_EMAIL_CHUNK))
+        try:
+            last_id = None
+            for chunk in db.session.execute(stmt).partitions():
+                errors = {}
+                for row in chunk:
+                    if row.id == last_id:
+                        continue  # Older submitted attempt of the same participant
+                    last_id = row.id
+                    stats["processed"] += 1
+                    try:
+                        paper = attempt_paper(row)
+                        pool.submit(row.id, build_results_email(
+                            row.email, attempt_questions(row, paper), attempt_answers(row, paper), row.score))
+                    except Exception as e:
+                        errors[row.id] = e
+                for participant_id, error in pool.wait():
+                    if error is not None:
+                        errors[participant_id] = error
+
+                for participant_id, error in errors.items():
+                    logger.error(f"Bulk email error for participant {participant_id}: {str(error)}")
+                if errors:
+                    now = datetime.utcnow()
+                    with db.engine.begin() as conn:
+                        conn.execute(db.insert(EmailJob), [
+                            {"participant_id": pid, "status": "pending", "run_at": now + retry_delay(1),
+                             "attempts": 1, "last_error": str(error)[:500], "created_at": now, "updated_at": now}
+                            for pid, error in errors.items()
+                        ])
+
+                stats["cursor"] = last_id
+                stats["failed"] += len(errors)
+                stats["sent"] = stats["processed"] - stats["failed"]
+                update_bulk_email_run(run_id, **stats)
+            update_bulk_email_run(run_id, status="done", finished_at=datetime.utcnow())
+            logger.info(f"Bulk email run {run_id} finished: {stats}")
+        except Exception as e:
+            logger.error(f"Bulk email run {run_id} error: {str(e)}")
+            update_bulk_email_run(run_id, status="failed", last_error=str(e)[:500])
+        finally:
+            db.session.rollback()
+            pool.close()
+
+@app.route("/admin/email_results", methods=["POST"])
+@require_auth
+@require_admin
+def email_all_results():
+    """Start emailing results to every participant, or resume an interrupted run (admin only)"""
     try:
-        msg = Message(
-            "Your Aptitude Quiz Results - ITian Club",
-            sender=app.config['MAIL_DEFAULT_SENDER'],
-            recipients=[participant_email]
-        )
+        run = BulkEmailRun.query.filter(BulkEmailRun.status != "done").order_by(BulkEmailRun.id.desc()).first()
+        if run:
+            # Claim it unless a live run is still reporting progress
+            claimed = BulkEmailRun.query.filter(
+                BulkEmailRun.id == run.id,
+                db.or_(BulkEmailRun.status == "failed",
+                       BulkEmailRun.updated_at < datetime.utcnow() - EMAIL_STALE_AFTER)
+            ).update({"status": "running", "last_error": None, "updated_at": datetime.utcnow()})
+            db.session.commit()
+            if not claimed:
+                return jsonify({"success": False, "error": "A bulk email run is already in progress",
+                                "run": bulk_email_progress(run)}), 409
+            db.session.refresh(run)
+        else:
+            total = Participant.query.filter(Participant.quiz_submitted.is_(True)).count()
+            run = BulkEmailRun(total=total)
+            db.session.add(run)
+            db.session.commit()
 
-        # Build detailed HTML content
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 0 auto;">
-            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; color: white; text-align: center;">
-                <h1>ITian Club Aptitude Quiz Results</h1>
-            </div>
-            <div style="padding: 20px;">
-                <h2>Congratulations!</h2>
-                <p>Thank you for participating in the ITian Club Aptitude Quiz.</p>
-                
-                <div style="background: #f8f9fa; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                    <h3>Your Score: {score}/{len(questions)}</h3>
-                    <p>Percentage: {(score/len(questions))*100:.1f}%</p>
-                </div>
-
-                <h3>Detailed Question Analysis:</h3>
-        """
-
-        current_category = None
-        for q in questions:
-            user_ans = answers.get(str(q['id']), [])
-            correct_ans = q['answer']
-            
-            # Add category header only once
-            if q['category'] != current_category:
-                html_body += f"<h4 style='color: #667eea; margin-top: 20px;'>{q['category']} Questions</h4>"
-                current_category = q['category']
-
-            # Determine if answer was correct
-            is_correct = False
-            if q.get("multiple"):
-                is_correct = set(user_ans) == set(correct_ans)
-            else:
-                is_correct = user_ans and user_ans[0] == correct_ans
-
-            status_color = "#28a745" if is_correct else "#dc3545"
-            status_text = "✓ Correct" if is_correct else "✗ Incorrect"
-
-            html_body += f"""
-                <div style="background: white; border-left: 4px solid {status_color}; padding: 15px; margin: 10px 0; border-radius: 4px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                    <p><strong>Q{q['id']}: {q['question']}</strong></p>
-                    <p style="margin: 5px 0;"><strong>Your Answer:</strong> {', '.join(user_ans) if user_ans else 'No answer'}</p>
-                    <p style="margin: 5px 0;"><strong>Correct Answer:</strong> {correct_ans}</p>
-                    <p style="margin: 5px 0; color: {status_color};"><strong>Status:</strong> {status_text}</p>
-                </div>
-            """
-
-        html_body += """
-                <hr style="margin: 30px 0;">
-                <div style="background: #f8f9fa; padding: 15px; border-radius: 8px;">
-                    <h4>Performance Summary:</h4>
-                    <p>• Review your answers to understand where you can improve</p>
-                    <p>• Focus on the categories where you scored lower</p>
-                    <p>• Practice similar questions to enhance your skills</p>
-                </div>
-                
-                <hr style="margin: 30px 0;">
-                <p><em>Thank you for your participation!</em></p>
-                <p><strong>– ITian Club Team</strong></p>
-            </div>
-        </body>
-        </html>
-        """
-
-        msg.html = html_body
-        mail.send(msg)
-        logger.info(f"Detailed email sent successfully to {participant_email}")
+        threading.Thread(target=run_bulk_email, args=(run.id,), name="bulk-email", daemon=True).start()
+        return jsonify({"success": True, "run": bulk_email_progress(run)}), 202
 
     except Exception as e:
-        logger.error(f"Email sending error: {str(e)}")
+        logger.error(f"Bulk email start error: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/admin/email_results/<int:run_id>")
+@require_auth
+@require_admin
+def email_all_results_progress(run_id):
+    """Progress of a bulk email run (admin only)"""
+    run = db.session.get(BulkEmailRun, run_id)
+    if not run:
+        abort(404)
+    return jsonify({"success": True, "run": bulk_email_progress(run)})
+
+@app.route("/admin/profiles", methods=["GET", "POST"])
+@require_auth
+@require_admin
+def request_profiles():
+    """List captured request profiles, or change what gets sampled (admin only)"""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            sample_rate = float(data.get("sample_rate", request_profiler.sample_rate))
+            endpoints = data.get("endpoints", sorted(request_profiler.endpoints))
+            kind = data.get("kind", request_profiler.kind)
+            if not 0 <= sample_rate <= 1 or kind not in PROFILE_KINDS or not isinstance(endpoints, list):
+                raise ValueError("expected sample_rate in [0, 1], a list of endpoints and kind cprofile or sample")
+            unknown = set(endpoints) - set(app.view_functions)
+            if unknown:
+                raise ValueError(f"unknown endpoints {', '.join(sorted(unknown))}")
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "error": f"Invalid profiling settings: {str(e)}"}), 400
+        request_profiler.sample_rate = sample_rate
+        request_profiler.endpoints = set(endpoints)
+        request_profiler.kind = kind
+        logger.info(f"Request profiling set to {request_profiler.settings()}")
+
+    return jsonify({
+        "success": True,
+        "settings": request_profiler.settings(),
+        "profiles": [{
+            "id": p.id,
+            "kind": p.kind,
+            "endpoint": p.endpoint,
+            "method": p.method,
+            "path": p.path,
+            "status": p.status,
+            "ms": round(p.seconds * 1000, 1),
+            "captured_at": p.captured_at.isoformat(),
+            "bytes": len(p.data),
+            "download": url_for("download_request_profile", profile_id=p.id)
+        } for p in request_profiler.profiles()]
+    })
+
+@app.route("/admin/profiles/<int:profile_id>")
+@require_auth
+@require_admin
+def download_request_profile(profile_id):
+    """Download a profile as a .prof file or folded stacks for a flamegraph (admin only)"""
+    profile = request_profiler.get(profile_id)
+    if not profile:
+        abort(404)
+    mimetype = "application/octet-stream" if profile.kind == "cprofile" else "text/plain"
+    return Response(profile.data, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={profile.filename}"})
+
+def recompute_analytics(chunk_size=5000):
+    """Rebuild every analytics counter from the stored attempts
+
+    Counters bumped by submissions that land while this runs may be lost, so
+    run it when the quiz is quiet (regrade calls it after re-scoring).
+    """
+    answer_key = compile_key(question_bank.get())
+    stmt = (db.select(Participant.branch, Participant.year, *ATTEMPT_COLUMNS)
+            .join(Participant, Participant.id == QuizAttempt.participant_id)
+            .where(QuizAttempt.graded_at.isnot(None))
+            .execution_options(yield_per=chunk_size))
+    counts = Counter()
+    for chunk in db.session.execute(stmt).partitions():
+        rows = []
+        for row in chunk:
+            paper = attempt_paper(row)
+            rows.append((paper[1], attempt_answers(row, paper), row.branch, row.year))
+        counts.update(count_submissions(answer_key, rows))
+
+    db.session.execute(db.delete(AnalyticsCounter))
+    bump_counters(counts)
+    db.session.commit()
+    return counts["submissions"]
+
+@app.cli.command("recompute-analytics")
+def recompute_analytics_command():
+    """Rebuild the analytics counters from every submitted attempt"""
+    print(f"Recomputed analytics from {recompute_analytics()} submissions.")
+
+@app.cli.command("regrade")
+def regrade_command():
+    """Re-grade every submitted quiz against the current answer key"""
+    bank = question_bank.get()
+    answer_key = compile_key(bank)
+    rows = (db.session.query(QuizAttempt.id, QuizAttempt.participant_id, Participant.score, *ATTEMPT_COLUMNS)
+            .join(Participant, Participant.id == QuizAttempt.participant_id)
+            .filter(QuizAttempt.graded_at.isnot(None))
+            .all())
+    if not rows:
+        print("No submissions to re-grade.")
+        return
+
+    masks = np.stack([answer_key.encode_row(attempt_answers(row)) for row in rows])
+    totals, by_category = answer_key.score_batch(masks)
+
+    participant_updates = []
+    attempt_updates = []
+    changed = 0
+    now = datetime.utcnow()
+    seqs = next_leaderboard_seqs(len(rows))
+    for (attempt_id, pid, old_score, *_), total, cat_scores, seq in zip(rows, totals.tolist(), by_category.tolist(),
+                                                                         seqs):
+        changed += old_score != total
+        # A new change number lets running workers pick the new scores up
+        participant_updates.append({"id": pid, "score": total, "updated_at": now, "leaderboard_seq": seq})
+        attempt_updates.append({"id": attempt_id, "category_scores": dict(zip(answer_key.categories, cat_scores))})
+
+    db.session.bulk_update_mappings(Participant, participant_updates)
+    db.session.bulk_update_mappings(QuizAttempt, attempt_updates)
+    db.session.commit()
+    print(f"Re-graded {len(participant_updates)} submissions, {changed} scores changed.")
+    recompute_analytics()
+
+def pending_email_jobs():
+    return db.session.query(db.func.count(EmailJob.id)).filter(EmailJob.status == "pending").scalar()
+
+metrics_registry.gauge("quiz_email_jobs_pending", "Results emails waiting to be sent", pending_email_jobs)
+metrics_registry.gauge("quiz_group_commit_queue_depth", "Writes waiting for the group commit thread",
+                       group_commits.depth)
+metrics_registry.gauge("quiz_grading_queue_depth", "Accepted submissions waiting for a grading worker",
+                       grading_pool.depth)
+metrics_registry.gauge("quiz_scheduler_jobs", "Jobs registered with the background scheduler",
+                       lambda: len(scheduler.get_jobs()))
+metrics_registry.gauge("quiz_leaderboard_stream_subscribers", "Open leaderboard event streams",
+                       lambda: leaderboard_events.subscribers)
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics for admins, or for a scraper presenting METRICS_TOKEN"""
+    token = app.config["METRICS_TOKEN"]
+    authorization = request.headers.get("Authorization", "")
+    if not (token and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())) and not is_admin():
+        abort(403)
+    try:
+        return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+    except Exception as e:
+        logger.error(f"Metrics error: {str(e)}")
+        return Response("metrics unavailable\n", status=500, mimetype="text/plain")
 
 # Error Handlers
 @app.errorhandler(404)
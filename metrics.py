@@ -0,0 +1,201 @@
+"""Request, database and session instrumentation in Prometheus text format
+
+``instrument_app`` hooks into a Flask app and its SQLAlchemy engine to record,
+per endpoint, request counts, latency, and how many queries each request ran
+and how long they took, plus time spent loading and saving sessions.  Gauges
+registered with ``Registry.gauge`` are read when the metrics are rendered,
+for values like queue depths that are cheap to look up but not worth
+tracking continuously.
+
+Metrics are kept per process; with several workers each reports its own.
+"""
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterMetric:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+
+class HistogramMetric:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels, labels, [('le', _number(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labels, labels, [('le', '+Inf')])} {values[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(values[-2])}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {values[-1]}"
+
+
+class GaugeCallback:
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_number(self.read())}"
+
+
+class Registry:
+    """Named metrics, rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(CounterMetric(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(HistogramMetric(name, help, labels, buckets))
+
+    def gauge(self, name, help, read):
+        """Gauge whose value is ``read()`` at render time"""
+        return self._add(GaugeCallback(name, help, read))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def instrument_app(app, engine, registry):
+    """Record per-endpoint request, query and session timings into ``registry``"""
+    requests_total = registry.counter(
+        "quiz_http_requests_total", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status"))
+    latency = registry.histogram(
+        "quiz_http_request_seconds", "Time to produce a response, by endpoint", ("endpoint", "method"))
+    query_count = registry.histogram(
+        "quiz_db_queries_per_request", "SQL statements run per request", ("endpoint",), QUERY_COUNT_BUCKETS)
+    query_time = registry.histogram(
+        "quiz_db_query_seconds_per_request", "Time spent in SQL statements per request", ("endpoint",))
+    background_queries = registry.counter(
+        "quiz_db_background_queries_total", "SQL statements run outside requests (scheduler, group commit)")
+    session_io = registry.histogram(
+        "quiz_session_io_seconds", "Time loading and saving sessions", ("backend", "operation"))
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        if has_request_context() and "metrics_start" in g:
+            g.metrics_queries += 1
+            g.metrics_query_time += time.perf_counter() - started
+        else:
+            background_queries.inc()
+
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    backend = app.config.get("SESSION_BACKEND", "filesystem")
+    interface = app.session_interface
+    open_session, save_session = interface.open_session, interface.save_session
+
+    def timed_open_session(app, request):
+        t0 = time.perf_counter()
+        try:
+            return open_session(app, request)
+        finally:
+            session_io.observe(time.perf_counter() - t0, (backend, "open"))
+
+    def timed_save_session(app, session, response):
+        t0 = time.perf_counter()
+        try:
+            return save_session(app, session, response)
+        finally:
+            session_io.observe(time.perf_counter() - t0, (backend, "save"))
+
+    interface.open_session = timed_open_session
+    interface.save_session = timed_save_session
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if "metrics_start" not in g:
+            return response
+        # Streamed responses are timed up to the first byte, not to the end of the stream
+        endpoint = request.endpoint or "unmatched"
+        requests_total.inc((endpoint, request.method, str(response.status_code)))
+        latency.observe(time.perf_counter() - g.metrics_start, (endpoint, request.method))
+        query_count.observe(g.metrics_queries, (endpoint,))
+        query_time.observe(g.metrics_query_time, (endpoint,))
+        return response
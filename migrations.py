@@ -0,0 +1,202 @@
+"""Schema migrations
+
+``db.create_all()`` creates missing tables but never changes existing ones, so
+databases created by an older release need these steps to catch up.  Each
+migration is a function taking a connection; it runs once, in order, and is
+recorded by name in the ``schema_migrations`` table.  Migrations must also be
+safe on a fresh database where ``create_all()`` already built the latest
+schema, hence the ``IF NOT EXISTS`` guards and column checks.
+"""
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import DateTime, LargeBinary, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(fn):
+    """Register a migration; migrations run in definition order"""
+    MIGRATIONS.append(fn)
+    return fn
+
+
+@migration
+def add_participant_leaderboard_indexes(conn):
+    # Submitted participants in score order
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_participant_leaderboard "
+        "ON participant (quiz_submitted, score DESC, created_at)"
+    ))
+
+
+@migration
+def move_attempt_details_off_participant(conn):
+    # Answers and category scores live on quiz_attempt; the participant row keeps scalars only
+    add_column(conn, "quiz_attempt", "answers", "JSON")
+    add_column(conn, "quiz_attempt", "category_scores", "JSON")
+    if not has_column(conn, "participant", "questions"):
+        return  # Fresh database, nothing to move
+
+    # Attempts recorded since attempts were introduced: copy their results across
+    conn.execute(text(
+        "UPDATE quiz_attempt SET "
+        "answers = (SELECT p.answers FROM participant p WHERE p.id = quiz_attempt.participant_id), "
+        "category_scores = (SELECT p.category_scores FROM participant p WHERE p.id = quiz_attempt.participant_id) "
+        "WHERE submitted_at IS NOT NULL AND answers IS NULL"
+    ))
+
+    # Older submissions have no attempt: rebuild one with question ids instead of question copies
+    rows = conn.execute(text(
+        "SELECT p.id, p.questions, p.answers, p.category_scores, p.created_at, p.updated_at "
+        "FROM participant p WHERE p.quiz_submitted = 1 AND NOT EXISTS ("
+        "SELECT 1 FROM quiz_attempt a WHERE a.participant_id = p.id AND a.submitted_at IS NOT NULL)"
+    )).fetchall()
+    for pid, questions, answers, category_scores, created_at, updated_at in rows:
+        question_ids = [q["id"] for q in json.loads(questions or "[]")]
+        conn.execute(text(
+            "INSERT INTO quiz_attempt (participant_id, question_ids, option_orders, answers, "
+            "category_scores, started_at, submitted_at) VALUES (:participant_id, :question_ids, "
+            ":option_orders, :answers, :category_scores, :started_at, :submitted_at)"
+        ), {
+            "participant_id": pid,
+            "question_ids": json.dumps(question_ids),
+            "option_orders": json.dumps([[] for _ in question_ids]),  # Empty means bank order
+            "answers": answers or "{}",
+            "category_scores": category_scores,
+            "started_at": created_at,
+            "submitted_at": updated_at
+        })
+
+    conn.execute(text("UPDATE participant SET answers = NULL, questions = NULL, category_scores = NULL"))
+
+
+@migration
+def add_attempt_seed(conn):
+    # Seed the sampler drew the paper from; NULL for papers drawn before
+    add_column(conn, "quiz_attempt", "seed", "BIGINT")
+
+
+@migration
+def add_compact_attempt_columns(conn):
+    # Paper spec to regenerate seeded papers, and the answer bitmap replacing answers JSON
+    add_column(conn, "quiz_attempt", "paper_spec", "VARCHAR(100)")
+    add_column(conn, "quiz_attempt", "answer_bits", LargeBinary().compile(dialect=conn.dialect))
+
+
+@migration
+def add_attempt_graded_at(conn):
+    # Submissions are accepted first and graded later; everything submitted so far was graded on the spot
+    add_column(conn, "quiz_attempt", "graded_at", DateTime().compile(dialect=conn.dialect))
+    conn.execute(text("UPDATE quiz_attempt SET graded_at = submitted_at WHERE submitted_at IS NOT NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_quiz_attempt_grading ON quiz_attempt (graded_at, submitted_at)"))
+
+
+@migration
+def add_participant_leaderboard_seq(conn):
+    # Leaderboard change numbers replace updated_at as the leaderboard version; number what is there in updated_at order
+    add_column(conn, "participant", "leaderboard_seq", "BIGINT")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_participant_leaderboard_seq ON participant (leaderboard_seq)"))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS version_counter (name VARCHAR(50) PRIMARY KEY, value BIGINT NOT NULL)"
+    ))
+    last = conn.execute(text("SELECT MAX(leaderboard_seq) FROM participant")).scalar() or 0
+    unnumbered = conn.execute(text(
+        "SELECT id FROM participant WHERE quiz_submitted = :submitted AND leaderboard_seq IS NULL "
+        "ORDER BY updated_at, id"
+    ), {"submitted": True}).fetchall()
+    if unnumbered:
+        conn.execute(text("UPDATE participant SET leaderboard_seq = :seq WHERE id = :id"),
+                     [{"seq": last + n, "id": pid} for n, (pid,) in enumerate(unnumbered, 1)])
+        last += len(unnumbered)
+    if conn.execute(text("SELECT 1 FROM version_counter WHERE name = 'leaderboard'")).first():
+        conn.execute(text("UPDATE version_counter SET value = :value WHERE name = 'leaderboard' AND value < :value"),
+                     {"value": last})
+    else:
+        conn.execute(text("INSERT INTO version_counter (name, value) VALUES ('leaderboard', :value)"),
+                     {"value": last})
+
+
+@migration
+def drop_participant_submitted_updated_index(conn):
+    # The leaderboard syncs on leaderboard_seq now; the updated_at index only slowed participant writes
+    conn.execute(text("DROP INDEX IF EXISTS ix_participant_submitted_updated"))
+
+@migration
+def add_attempt_grading_failures(conn):
+    # Failed gradings per attempt, so the sweep stops re-queueing one that keeps failing
+    add_column(conn, "quiz_attempt", "grading_failures", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "quiz_attempt", "grading_error", "VARCHAR(500)")
+
+
+@migration
+def add_attempt_sampler_version(conn):
+    # Seeded papers so far were all drawn by sampler version 1
+    add_column(conn, "quiz_attempt", "sampler_version", "INTEGER")
+    conn.execute(text("UPDATE quiz_attempt SET sampler_version = 1 WHERE seed IS NOT NULL AND sampler_version IS NULL"))
+
+
+@migration
+def add_open_attempt_unique_index(conn):
+    # At most one open attempt per participant, so concurrent quiz starts cannot each open one
+    if conn.dialect.name not in ("sqlite", "postgresql"):
+        return  # No partial indexes; new_attempt's check-then-insert is all there is
+    # Only the newest open attempt was ever served or sealed; older duplicates are unreachable
+    duplicates = conn.execute(text(
+        "SELECT a.id FROM quiz_attempt a WHERE a.submitted_at IS NULL AND EXISTS ("
+        "SELECT 1 FROM quiz_attempt b WHERE b.participant_id = a.participant_id "
+        "AND b.submitted_at IS NULL AND b.id > a.id)"
+    )).fetchall()
+    for (attempt_id,) in duplicates:
+        conn.execute(text("DELETE FROM answer_save WHERE attempt_id = :id"), {"id": attempt_id})
+        conn.execute(text("DELETE FROM quiz_attempt WHERE id = :id"), {"id": attempt_id})
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_quiz_attempt_open ON quiz_attempt (participant_id) "
+        "WHERE submitted_at IS NULL"
+    ))
+
+
+def has_column(conn, table, name):
+    return name in {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def add_column(conn, table, name, ddl):
+    """Add a column unless create_all() already built it"""
+    if not has_column(conn, table, name):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def run_migrations(engine, migrations=None):
+    """Apply every migration not yet recorded in schema_migrations"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR(100) PRIMARY KEY, applied_at DATETIME)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for fn in MIGRATIONS if migrations is None else migrations:
+        if fn.__name__ in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                fn(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                    {"name": fn.__name__, "applied_at": datetime.utcnow()}
+                )
+            logger.info(f"Applied migration {fn.__name__}")
+        except IntegrityError:
+            # Another worker may have applied it while we were starting up; anything else is a real failure
+            with engine.connect() as conn:
+                recorded = conn.execute(
+                    text("SELECT 1 FROM schema_migrations WHERE name = :name"), {"name": fn.__name__}
+                ).first()
+            if not recorded:
+                logger.error(f"Migration {fn.__name__} failed")
+                raise
+            logger.info(f"Migration {fn.__name__} already applied")
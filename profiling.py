@@ -0,0 +1,171 @@
+"""On-demand request profiling
+
+A request is profiled when an admin asks for it with an ``X-Profile`` header
+or a ``_profile`` query parameter, or when it hits one of the sampled
+endpoints and wins the sample-rate draw.  Two kinds of profile are captured:
+
+``cprofile``  Deterministic cProfile stats, downloadable as a ``.prof`` file
+              for pstats, snakeviz and friends
+``sample``    Wall-clock stack samples of the request thread in the folded
+              format read by flamegraph.pl and speedscope; cheaper, and shows
+              time spent waiting on locks and I/O
+
+Only one request is profiled at a time; others arriving meanwhile run
+unprofiled.  The last ``keep`` profiles are held in memory.
+"""
+import cProfile
+import itertools
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import NamedTuple
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("cprofile", "sample")
+EXTENSIONS = {"cprofile": "prof", "sample": "folded"}
+
+
+class Profile(NamedTuple):
+    id: int
+    kind: str
+    endpoint: str
+    method: str
+    path: str
+    status: int
+    seconds: float
+    captured_at: datetime
+    data: bytes
+
+    @property
+    def filename(self):
+        return f"{self.endpoint}-{self.id}.{EXTENSIONS[self.kind]}"
+
+
+class StackSampler:
+    """Samples one thread's stack every ``interval`` seconds from a helper thread"""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    """Profiles selected requests of a Flask app into a bounded ring buffer"""
+
+    def __init__(self, keep=20, sample_rate=0.0, endpoints=(), kind="cprofile"):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown profile kind {kind!r}")
+        self.sample_rate = sample_rate
+        self.endpoints = set(endpoints)
+        self.kind = kind
+        self._profiles = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    def init_app(self, app, is_admin):
+        """Install the request hooks; ``is_admin()`` gates explicit requests"""
+
+        @app.before_request
+        def start_profile():
+            kind = self._requested_kind(is_admin)
+            if kind is None or not self._busy.acquire(blocking=False):
+                return
+            try:
+                if kind == "cprofile":
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                else:
+                    profiler = StackSampler(threading.get_ident())
+                    profiler.start()
+            except Exception as e:
+                # e.g. another profiler already active on this interpreter
+                self._busy.release()
+                logger.warning(f"Could not start {kind} profile: {str(e)}")
+                return
+            g.profile = (kind, profiler, time.perf_counter())
+
+        @app.after_request
+        def finish_profile(response):
+            self._finish(response.status_code)
+            return response
+
+        @app.teardown_request
+        def abandon_profile(exception=None):
+            # after_request is skipped when a request fails outright
+            self._finish(500)
+
+    def _requested_kind(self, is_admin):
+        asked = request.headers.get("X-Profile") or request.args.get("_profile")
+        if asked:
+            if not is_admin():
+                return None
+            return asked if asked in KINDS else "cprofile"
+        if self.sample_rate and request.endpoint in self.endpoints and random.random() < self.sample_rate:
+            return self.kind
+        return None
+
+    def _finish(self, status):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        kind, profiler, started = profile
+        try:
+            seconds = time.perf_counter() - started
+            if kind == "cprofile":
+                profiler.disable()
+                profiler.create_stats()
+                data = marshal.dumps(profiler.stats)  # The format pstats.Stats.dump_stats writes
+            else:
+                data = profiler.stop()
+            with self._lock:
+                self._profiles.append(Profile(
+                    next(self._ids), kind, request.endpoint or "unmatched", request.method,
+                    request.full_path.rstrip("?"), status, seconds, datetime.utcnow(), data
+                ))
+        finally:
+            self._busy.release()
+
+    def settings(self):
+        return {"sample_rate": self.sample_rate, "endpoints": sorted(self.endpoints), "kind": self.kind,
+                "keep": self._profiles.maxlen}
+
+    def profiles(self):
+        """Captured profiles, newest first"""
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
@@ -0,0 +1,122 @@
+"""Question bank loaded from questions.json
+
+The bank is parsed once into an immutable snapshot indexed by question id and
+by category.  Routes call ``bank.get()`` which returns the current snapshot and
+transparently swaps in a fresh one when questions.json changes on disk.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class Question(NamedTuple):
+    id: int
+    category: str
+    question: str
+    options: Tuple[str, ...]
+    answer: Union[str, Tuple[str, ...]]
+    multiple: bool = False
+    difficulty: str = "medium"
+
+
+class BankSnapshot:
+    """Immutable view of one version of the question bank"""
+
+    __slots__ = ("version", "mtime", "questions", "by_id", "by_category", "categories")
+
+    def __init__(self, questions, version, mtime=None):
+        self.version = version
+        self.mtime = mtime
+        self.questions = tuple(questions)
+        self.by_id = MappingProxyType({q.id: q for q in self.questions})
+
+        by_category = {}
+        for q in self.questions:
+            by_category.setdefault(q.category, []).append(q)
+        self.by_category = MappingProxyType({c: tuple(qs) for c, qs in by_category.items()})
+        self.categories = tuple(self.by_category)
+
+    def __len__(self):
+        return len(self.questions)
+
+
+def _parse_question(raw):
+    """Convert one JSON question into an immutable Question"""
+    multiple = bool(raw.get("multiple", False))
+    answer = raw["answer"]
+    if multiple:
+        answer = tuple(answer)
+    options = tuple(raw["options"])
+    if not set(answer if multiple else (answer,)) <= set(options):
+        raise ValueError(f"Question {raw['id']} has an answer that is not one of its options")
+    return Question(
+        id=int(raw["id"]),
+        category=raw["category"],
+        question=raw["question"],
+        options=options,
+        answer=answer,
+        multiple=multiple,
+        difficulty=raw.get("difficulty", "medium"),
+    )
+
+
+def parse_bank(data: bytes, mtime=None, version=None) -> BankSnapshot:
+    """Build a snapshot from the raw bytes of questions.json
+
+    ``version`` defaults to a hash of ``data``; archived banks pass their own.
+    """
+    questions = [_parse_question(raw) for raw in json.loads(data)]
+    ids = [q.id for q in questions]
+    if len(ids) != len(set(ids)):
+        raise ValueError("Duplicate question ids in question bank")
+    version = version or hashlib.sha1(data).hexdigest()[:12]
+    return BankSnapshot(questions, version, mtime)
+
+
+class QuestionBank:
+    """Lazily loaded question bank that reloads when its file changes"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[BankSnapshot] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> BankSnapshot:
+        """Return the current snapshot, reloading it if the file changed"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now < self._next_check:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now < self._next_check:
+                return snapshot
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if snapshot is None or snapshot.mtime != mtime:
+                    snapshot = self._load(mtime)
+            except Exception as e:
+                if snapshot is None:
+                    raise
+                logger.error(f"Question bank reload error: {str(e)}")
+            return snapshot
+
+    def _load(self, mtime) -> BankSnapshot:
+        with open(self.path, "rb") as fh:
+            data = fh.read()
+        snapshot = parse_bank(data, mtime)
+        # Swap the reference in one assignment so readers never see a partial bank
+        self._snapshot = snapshot
+        logger.info(f"Loaded question bank {snapshot.version} ({len(snapshot)} questions)")
+        return snapshot
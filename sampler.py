@@ -0,0 +1,177 @@
+"""Stratified, seeded paper sampler
+
+A paper is drawn per category from difficulty tiers (strata), e.g. one easy
+and one medium question from every category.  Each stratum is precomputed
+once per bank snapshot as an array of positions into ``bank.questions``, so a
+draw touches only the questions it picks: O(questions on the paper) whatever
+the size of the bank.
+
+Draws are deterministic: the same bank, spec, seed and excluded ids always
+give the same paper, so an attempt can be regenerated from its seed.  That
+holds only for one version of this code and of NumPy's ``Generator``, whose
+streams NumPy does not promise to keep across releases.  Attempts record
+``SAMPLER_VERSION``, and ``check_stream`` compares a fixed draw from a
+fixture bank against the paper it gave when that version was recorded, so
+a NumPy upgrade that changes the stream stops the app at startup instead of
+silently matching stored answers to different questions.  Any change to
+what a seed draws must bump ``SAMPLER_VERSION`` and keep the old code for
+replaying older attempts.
+"""
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from question_bank import parse_bank
+
+ANY = "any"  # Spec key drawing from every difficulty of a category
+SAMPLER_VERSION = 1
+
+# check_stream draws from this bank: three categories, each with three questions per tier
+_FIXTURE_BANK = json.dumps([
+    {"id": 100 * c + 10 * t + n, "category": category, "question": f"{category} {tier} {n}",
+     "options": ["a", "b", "c", "d"][:2 + n], "answer": "a", "difficulty": tier}
+    for c, category in enumerate(["Math", "Reasoning", "Verbal"], 1)
+    for t, tier in enumerate(["easy", "medium", "hard"])
+    for n in range(3)
+]).encode()
+# (seed, spec, excluded ids) -> (question_ids, option_orders) as drawn by SAMPLER_VERSION 1 on NumPy 2.4
+_FIXTURE_DRAWS = [
+    ((20240601, {"easy": 1, "hard": 2}, ()),
+     [[122, 120, 222, 322, 221, 301, 201, 320, 100],
+      [[0, 3, 1, 2], [0, 1], [1, 0, 3, 2], [0, 1, 2, 3], [1, 0, 2], [2, 0, 1], [0, 1, 2], [0, 1], [0, 1]]]),
+    # Math has one unseen question left, so it is topped up from the excluded ones
+    ((7, {ANY: 2}, (100, 101, 102, 110, 111, 112, 120, 121)),
+     [[302, 212, 122, 220, 321, 121],
+      [[1, 0, 2, 3], [0, 3, 2, 1], [2, 1, 3, 0], [1, 0], [2, 1, 0], [1, 2, 0]]]),
+]
+
+
+def parse_spec(text):
+    """Parse "easy:1,medium:1" into {"easy": 1, "medium": 1}
+
+    Only the syntax is checked, so stored specs always replay; use
+    ``Sampler.check_spec`` before drawing new papers from one.
+    """
+    spec = {}
+    for part in text.split(","):
+        tier, _, count = part.strip().partition(":")
+        spec[tier.strip()] = int(count)
+    return spec
+
+
+class Sampler:
+    """Per-stratum position arrays for one question bank snapshot"""
+
+    def __init__(self, bank):
+        self.version = bank.version
+        self.categories = bank.categories
+        self.question_ids = np.array([q.id for q in bank.questions], dtype=np.int64)
+        self.option_counts = np.array([len(q.options) for q in bank.questions], dtype=np.int64)
+
+        strata = {}
+        for position, q in enumerate(bank.questions):
+            strata.setdefault((q.category, q.difficulty), []).append(position)
+            strata.setdefault((q.category, ANY), []).append(position)
+        self.strata = {key: np.array(positions, dtype=np.int64) for key, positions in strata.items()}
+        self.tiers = {tier for _, tier in self.strata if tier != ANY}
+        self._stratum_of = {}
+        for (category, tier), positions in self.strata.items():
+            if tier != ANY:
+                for position in positions.tolist():
+                    self._stratum_of[int(self.question_ids[position])] = (category, tier)
+
+    def check_spec(self, spec):
+        """Raise ValueError unless ``spec`` draws from distinct tiers this bank has
+
+        ``ANY`` overlaps every tier, so mixing it with tiers could put a
+        question on the paper twice; an unknown tier would silently draw nothing.
+        """
+        if ANY in spec and len(spec) > 1:
+            raise ValueError(f"Paper spec cannot mix {ANY!r} with difficulty tiers: {spec}")
+        unknown = set(spec) - self.tiers - {ANY}
+        if unknown:
+            raise ValueError(f"Unknown difficulty tiers {', '.join(sorted(unknown))} in paper spec; "
+                             f"the question bank has {', '.join(sorted(self.tiers))}")
+
+    def draw(self, seed, spec, exclude=(), version=SAMPLER_VERSION):
+        """Draw a paper as (question_ids, option_orders), both in display order
+
+        ``spec`` maps difficulty tiers (or ``ANY``) to a count per category.
+        Questions in ``exclude`` are only used once a stratum has run out of
+        others.  A stratum smaller than its count contributes what it has.
+        ``version`` is the SAMPLER_VERSION the paper was first drawn with.
+        """
+        if version != SAMPLER_VERSION:
+            raise ValueError(f"Cannot replay sampler version {version}; this is version {SAMPLER_VERSION}")
+        rng = np.random.default_rng(seed)
+        exclude = set(exclude)
+        blocked = {}
+        for qid in exclude:
+            stratum = self._stratum_of.get(qid)
+            if stratum:
+                blocked[stratum] = blocked.get(stratum, 0) + 1
+                blocked[(stratum[0], ANY)] = blocked.get((stratum[0], ANY), 0) + 1
+
+        positions = []
+        for category in self.categories:
+            for tier, count in spec.items():
+                pool = self.strata.get((category, tier))
+                if pool is None or count <= 0:
+                    continue
+                k = min(count, len(pool))
+                positions.extend(self._pick(rng, pool, k, exclude, blocked.get((category, tier), 0)))
+
+        positions = np.array(positions, dtype=np.int64)[rng.permutation(len(positions))]
+        counts = self.option_counts[positions]
+        # One random key per option slot; padding sorts last, leaving each row's permutation first
+        keys = rng.random((len(positions), int(counts.max(initial=0))))
+        keys[np.arange(keys.shape[1]) >= counts[:, np.newaxis]] = 2.0
+        orders = keys.argsort(axis=1).tolist()
+        question_ids = self.question_ids[positions].tolist()
+        return question_ids, [order[:n] for order, n in zip(orders, counts.tolist())]
+
+    def _pick(self, rng, pool, k, exclude, blocked):
+        """k distinct positions from pool, avoiding excluded ids while possible"""
+        n = len(pool)
+        if n - blocked < k:
+            # Too few unseen questions: take all of them and top up with seen ones
+            unseen = [p for p in pool.tolist() if int(self.question_ids[p]) not in exclude]
+            seen = [p for p in pool.tolist() if int(self.question_ids[p]) in exclude]
+            extra = rng.choice(len(seen), size=k - len(unseen), replace=False).tolist()
+            return unseen + [seen[i] for i in extra]
+
+        # Rejection sampling over indexes: expected O(k) while most of the pool is unseen
+        picked = []
+        tried = set()
+        while len(picked) < k:
+            for i in rng.integers(n, size=2 * k + 4).tolist():
+                if i in tried:
+                    continue
+                tried.add(i)
+                position = int(pool[i])
+                if blocked and int(self.question_ids[position]) in exclude:
+                    continue
+                picked.append(position)
+                if len(picked) == k:
+                    break
+        return picked
+
+
+@lru_cache(maxsize=4)
+def compile_sampler(bank):
+    """Build (and cache) the sampler for a bank snapshot"""
+    return Sampler(bank)
+
+
+def check_stream():
+    """Raise RuntimeError if seeds no longer draw the papers SAMPLER_VERSION recorded"""
+    sampler = Sampler(parse_bank(_FIXTURE_BANK))
+    for (seed, spec, exclude), expected in _FIXTURE_DRAWS:
+        question_ids, option_orders = sampler.draw(seed, spec, exclude)
+        if [question_ids, option_orders] != expected:
+            raise RuntimeError(
+                f"Sampler version {SAMPLER_VERSION} draws a different paper for seed {seed} with NumPy "
+                f"{np.__version__}, so stored attempts would decode against the wrong questions; install the "
+                f"NumPy release in requirements.txt, or bump SAMPLER_VERSION and keep the old draw for old attempts"
+            )
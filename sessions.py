@@ -0,0 +1,188 @@
+"""Pluggable session backends
+
+Choose one with the SESSION_BACKEND setting:
+
+``filesystem``  Flask-Session's file-per-session store (the original setup)
+``memory``      In-process LRU store; fastest, but sessions live in one process
+``sqlite``      Shared SQLite file in WAL mode; works across workers on one host
+``cookie``      Flask's signed cookie; no server-side state at all
+
+The memory and sqlite backends keep only a random session id in the cookie
+and write the store only when the session actually changed.
+"""
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session whose data is kept server-side under ``sid``"""
+
+    def __init__(self, initial=None, sid=None, new=False, payload=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.payload = payload  # Serialized form as loaded, to skip no-op writes
+
+
+class LRUStore:
+    """Bounded in-process session store"""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is None:
+                return None
+            expires, payload = item
+            if expires <= time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return payload
+
+    def set(self, sid, payload, ttl):
+        with self._lock:
+            self._data[sid] = (time.time() + ttl, payload)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+
+class SQLiteStore:
+    """Session store in a SQLite file, one connection per thread"""
+
+    PURGE_EVERY = 1000  # Writes between sweeps of expired sessions
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, payload TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            "SELECT payload FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, payload, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (sid, payload, expires) VALUES (?, ?, ?)",
+            (sid, payload, time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def delete(self, sid):
+        self._connect().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def purge_expired(self):
+        self._connect().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Session interface storing serialized sessions in a key/value store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            payload = self.store.get(sid)
+            if payload is not None:
+                try:
+                    return ServerSession(serializer.loads(payload), sid=sid, payload=payload)
+                except ValueError:
+                    logger.warning("Discarding unreadable session")
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            # Routes pop _flashes on every page load, which marks the session
+            # modified even when nothing changed
+            payload = serializer.dumps(dict(session))
+            if payload != session.payload:
+                ttl = app.permanent_session_lifetime.total_seconds()
+                self.store.set(session.sid, payload, ttl)
+
+        if session.new or (session.permanent and app.config["SESSION_REFRESH_EACH_REQUEST"]):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+
+def init_sessions(app):
+    """Install the session backend named by app.config["SESSION_BACKEND"]"""
+    backend = app.config.get("SESSION_BACKEND", "filesystem")
+    if backend == "filesystem":
+        from flask_session import Session
+        Session(app)
+    elif backend == "memory":
+        app.session_interface = ServerSideSessionInterface(LRUStore())
+    elif backend == "sqlite":
+        path = app.config.get("SESSION_SQLITE_PATH") or os.path.join(app.instance_path, "sessions.db")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        app.session_interface = ServerSideSessionInterface(SQLiteStore(path))
+    elif backend == "cookie":
+        app.session_interface = SecureCookieSessionInterface()
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
+    logger.info(f"Using {backend} session backend")
@@ -0,0 +1,174 @@
+/**
+ * Quiz Autosave Module
+ * Sends answer changes to the server in small numbered batches while the quiz
+ * is in progress, and restores saved answers when the page is reloaded.
+ * A batch keeps its number when retried, so the server can drop repeats.
+ * On submit the form sends only the answers the server has not acknowledged;
+ * the server takes the rest from the saved batches.
+ */
+
+class QuizAutosave {
+    constructor(form) {
+        this.form = form;
+        this.url = form.dataset.autosaveUrl;
+        this.attemptId = parseInt(form.dataset.attempt, 10);
+        this.seq = parseInt(form.dataset.lastSeq, 10) || 0;
+        this.pending = {};          // question id -> chosen options, not yet batched
+        this.unsaved = new Map();   // seq -> batch, until the server acknowledges it
+        this.sending = new Set();
+        this.saved = {};            // question id -> options the server has acknowledged
+        this.savedSeq = {};         // question id -> seq of the batch that saved them
+        this.flushTimer = null;
+        this.retryTimer = null;
+        this.retryDelay = 2000;
+        this.flushDelay = 1500;     // ms to wait for more changes before sending
+        this.restoring = false;
+        this.stopped = false;
+
+        this.setupEventListeners();
+        // After QuizApp has wired up its option handlers
+        setTimeout(() => this.restore(), 0);
+    }
+
+    setupEventListeners() {
+        this.form.querySelectorAll('.option-input').forEach(input => {
+            input.addEventListener('change', () => this.recordChange(input.name));
+        });
+
+        // Save what we have whenever the tab may be going away
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') this.flush(true);
+        });
+        window.addEventListener('pagehide', () => this.flush(true));
+
+        this.form.addEventListener('submit', () => {
+            this.stopped = true;
+        });
+        // Also fires for form.submit(), which the timer uses and which skips 'submit'
+        this.form.addEventListener('formdata', event => {
+            this.stopped = true;
+            const names = new Set(Array.from(this.form.querySelectorAll('.option-input'), input => input.name));
+            names.forEach(name => event.formData.delete(name));
+            event.formData.set('unsaved_answers', JSON.stringify(this.unsavedAnswers(names)));
+        });
+    }
+
+    restore() {
+        const saved = document.getElementById('savedAnswers');
+        if (!saved) return;
+
+        const answers = JSON.parse(saved.textContent || '{}');
+        Object.entries(answers).forEach(([questionId, choices]) => {
+            this.saved[questionId] = choices;
+            this.savedSeq[questionId] = this.seq;
+        });
+        this.restoring = true;
+        Object.entries(answers).forEach(([questionId, choices]) => {
+            this.form.querySelectorAll(`.option-input[name="q${questionId}"]`).forEach(input => {
+                if (choices.includes(input.value) && !input.checked) {
+                    input.checked = true;
+                    // Let QuizApp mark the option and the question as answered
+                    input.dispatchEvent(new Event('change', { bubbles: true }));
+                }
+            });
+        });
+        this.restoring = false;
+        console.log(`Restored ${Object.keys(answers).length} saved answers`);
+    }
+
+    recordChange(name) {
+        if (this.restoring || this.stopped) return;
+
+        const questionId = name.replace(/^q/, '');
+        this.pending[questionId] = this.checkedValues(name);
+
+        clearTimeout(this.flushTimer);
+        this.flushTimer = setTimeout(() => this.flush(), this.flushDelay);
+    }
+
+    checkedValues(name) {
+        return Array.from(this.form.querySelectorAll(`.option-input[name="${name}"]:checked`), input => input.value);
+    }
+
+    unsavedAnswers(names) {
+        // A question still in a pending or unacknowledged batch may or may not be in the log, so
+        // send it; otherwise send it only if it differs from what the server acknowledged
+        const dirty = new Set(Object.keys(this.pending));
+        this.unsaved.forEach(batch => Object.keys(batch.answers).forEach(questionId => dirty.add(questionId)));
+
+        const answers = {};
+        names.forEach(name => {
+            const questionId = name.replace(/^q/, '');
+            const checked = this.checkedValues(name);
+            const saved = this.saved[questionId] || [];
+            if (dirty.has(questionId) || checked.length !== saved.length || checked.some(v => !saved.includes(v))) {
+                answers[questionId] = checked;
+            }
+        });
+        return answers;
+    }
+
+    flush(leaving = false) {
+        if (this.stopped) return;
+        clearTimeout(this.flushTimer);
+
+        if (Object.keys(this.pending).length > 0) {
+            const batch = { attempt: this.attemptId, seq: ++this.seq, answers: this.pending };
+            this.unsaved.set(batch.seq, batch);
+            this.pending = {};
+        }
+        // Batches are replayed in seq order on the server, so they may arrive in any order
+        this.unsaved.forEach(batch => {
+            if (leaving || !this.sending.has(batch.seq)) this.send(batch, leaving);
+        });
+    }
+
+    send(batch, leaving) {
+        this.sending.add(batch.seq);
+        fetch(this.url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(batch),
+            credentials: 'same-origin',
+            keepalive: leaving
+        }).then(response => {
+            if (response.status === 409) {
+                // Already submitted, e.g. from another tab; nothing more to save
+                this.stopped = true;
+                this.unsaved.clear();
+                return;
+            }
+            if (response.status >= 500) throw new Error(`HTTP ${response.status}`);
+            if (response.ok) {
+                // Saved, or a repeat of a saved batch; acks may arrive out of order
+                Object.entries(batch.answers).forEach(([questionId, choices]) => {
+                    if (batch.seq > (this.savedSeq[questionId] || 0)) {
+                        this.saved[questionId] = choices;
+                        this.savedSeq[questionId] = batch.seq;
+                    }
+                });
+            }
+            // Rejected as invalid is not saved, but retrying will not help either
+            this.unsaved.delete(batch.seq);
+            this.retryDelay = 2000;
+        }).catch(error => {
+            console.warn('Autosave failed, will retry:', error);
+            if (!this.retryTimer) {
+                this.retryTimer = setTimeout(() => {
+                    this.retryTimer = null;
+                    this.flush();
+                }, this.retryDelay);
+                this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+            }
+        }).finally(() => {
+            this.sending.delete(batch.seq);
+        });
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const form = document.getElementById('quizForm');
+    if (form && form.dataset.autosaveUrl) {
+        window.quizAutosave = new QuizAutosave(form);
+    }
+});